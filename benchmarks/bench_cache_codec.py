@@ -0,0 +1,126 @@
+"""
+Micro-benchmark du codec de la table metadata.
+
+Compare l'ancien stockage (json.dumps / json.loads en texte) au codec de
+fkstream.utils.cache_codec (orjson, avec compression zlib ou zstd) sur des charges
+de la taille de fk:list et d'un anime complet (saisons, épisodes, acteurs).
+
+Usage : python -m benchmarks.bench_cache_codec [--payload fichier.json] [--repeat 200]
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+
+import orjson
+
+from fkstream.utils import cache_codec
+from fkstream.utils.cache_codec import decode_cache_value, encode_cache_value
+
+WORDS = (
+    "après la mort de son mentor le héros quitte village et parcourt monde à recherche ses compagnons "
+    "disparus chaque arc condense plusieurs dizaines d'épisodes série d'origine en supprimant remplissage "
+    "les récapitulatifs combat pirate ninja trésor royaume démon équipage île tournoi frère promesse"
+).split()
+
+_random = random.Random(42)
+
+
+def _plot(words: int) -> str:
+    """Résumé pseudo-aléatoire : des textes tous différents, pour ne pas surestimer la compression."""
+    return ' '.join(_random.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _series(series_id: int) -> dict:
+    return {
+        "id": series_id,
+        "title": f"Série {series_id} Kaï",
+        "genres": "Action, Aventure, Fantastique",
+        "plot": _plot(90),
+        "poster_image": f"https://metadata.fankai.fr/series/{series_id}/poster",
+        "logo_image": f"https://metadata.fankai.fr/series/{series_id}/logo",
+        "fanart_image": f"https://metadata.fankai.fr/series/{series_id}/fanart",
+        "trailer_url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "imdb_id": f"tt{series_id:07d}",
+        "rating_value": 8.4,
+        "year": 2004,
+        "status": "Ended",
+        "last_update": "2024-06-01 10:00:00",
+    }
+
+
+def synthetic_payloads() -> dict:
+    """fk:list de 150 séries et un anime de 8 saisons x 25 épisodes avec 40 acteurs."""
+    anime = _series(1)
+    anime["seasons"] = [
+        {
+            "id": season,
+            "season_number": season,
+            "episodes": [
+                {
+                    "id": season * 1000 + number,
+                    "title": f"Épisode {number} - L'arc de la saison {season}",
+                    "episode_number": number,
+                    "season_number": season,
+                    "plot": _plot(50),
+                    "aired": "2024-01-01",
+                    "nfo_filename": f"Serie Kai - {season}x{number:02d} - Episode {number} MULTI 1080p.nfo",
+                }
+                for number in range(1, 26)
+            ],
+        }
+        for season in range(1, 9)
+    ]
+    anime["actors"] = [{"id": i, "name": f"Acteur {i}", "role": f"Personnage {i}"} for i in range(40)]
+    return {
+        "fk:list": [_series(i) for i in range(150)],
+        "fk:<anime>": anime,
+    }
+
+
+def _time(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_payload(name: str, data, repeat: int) -> None:
+    print(f"{name}")
+    variants = [("json texte (ancien)", lambda: json.dumps(data).encode(), lambda v: json.loads(v.decode()))]
+    variants.append(("orjson sans compression", lambda: b"\x01" + orjson.dumps(data), decode_cache_value))
+    variants.append(("orjson + zlib", lambda: encode_cache_value(data, "zlib"), decode_cache_value))
+    if cache_codec.zstandard:
+        variants.append(("orjson + zstd", lambda: encode_cache_value(data, "zstd"), decode_cache_value))
+    else:
+        print("  (zstandard non installe, variante zstd ignoree)")
+
+    for label, encode, decode in variants:
+        value = encode()
+        assert decode(value) == data
+        encode_time = _time(encode, repeat)
+        decode_time = _time(lambda: decode(value), repeat)
+        print(f"  {label:<26} {len(value) / 1024:9.1f} Kio  encodage {encode_time * 1e6:9.1f} us  decodage {decode_time * 1e6:9.1f} us")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payload', help="fichier JSON reel a mesurer (ex: export d'une ligne fk:list)")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, 'rb') as f:
+            payloads = {args.payload: orjson.loads(f.read())}
+    else:
+        payloads = synthetic_payloads()
+
+    print(f"Seuil de compression : {cache_codec.COMPRESSION_THRESHOLD} octets, zlib niveau {cache_codec.ZLIB_LEVEL} (zlib {zlib.ZLIB_VERSION})\n")
+    for name, data in payloads.items():
+        bench_payload(name, data, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark du moteur de matching sur dataset.json.
+
+Compare l'ancien matcher (copie conservée dans benchmarks.legacy_matcher : boucles imbriquées
+épisode x fichier, normalisation recalculée à chaque comparaison) à l'API batch de fkstream.utils.matcher.
+
+Usage : python -m benchmarks.bench_matcher [--dataset dataset.json] [--repeat 5]
+"""
+import argparse
+import time
+
+import orjson
+
+from benchmarks.legacy_matcher import stream_find_best_file
+from fkstream.utils.general import is_video
+from fkstream.utils.matcher import base_name, match_episodes, normalize_filename
+
+
+def _load_sources(path: str) -> list:
+    """Retourne, pour chaque torrent, ses fichiers et les nfo_filename à matcher."""
+    with open(path, 'rb') as f:
+        dataset = orjson.loads(f.read())
+    sources = []
+    for anime in dataset.get('top', []):
+        for source in anime.get('sources', []):
+            files = source.get('files', [])
+            # Variante en minuscules pour forcer le passage par la correspondance normalisée
+            episodes = {
+                i: f"{base_name(name).lower()}.nfo"
+                for i, name in enumerate(files) if is_video(name)
+            }
+            sources.append((files, episodes))
+    return sources
+
+
+def naive_match(files: list, episodes: dict) -> dict:
+    """Ancien matcher de la table de correspondance : un parcours des fichiers par épisode, sans mémorisation."""
+    return {key: stream_find_best_file(files, nfo_filename) for key, nfo_filename in episodes.items()}
+
+
+def _bench(label: str, func, sources: list, repeat: int, before=None) -> float:
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        for files, episodes in sources:
+            func(files, episodes)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{label:<36} {best * 1000:9.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='dataset.json')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sources = _load_sources(args.dataset)
+    file_count = sum(len(files) for files, _ in sources)
+    episode_count = sum(len(episodes) for _, episodes in sources)
+    print(f"{len(sources)} torrents, {file_count} fichiers, {episode_count} episodes a matcher\n")
+
+    # Le nouveau moteur trouve tout ce que trouvait l'ancien ; il peut préférer un autre fichier
+    # quand plusieurs se normalisent pareil (VO/VF), la correspondance exacte sans casse passant avant
+    differences = 0
+    for files, episodes in sources:
+        old, new = naive_match(files, episodes), match_episodes(episodes, files)
+        assert all(new[key] is not None for key, index in old.items() if index is not None)
+        differences += sum(1 for key in old if old[key] != new[key])
+    print(f"{differences} episodes matches differemment de l'ancien matcher\n")
+
+    naive = _bench("boucles imbriquees (ancien)", naive_match, sources, args.repeat)
+    cold = _bench("batch, cache de normalisation vide", lambda f, e: match_episodes(e, f), sources, args.repeat, before=normalize_filename.cache_clear)
+    warm = _bench("batch, cache de normalisation chaud", lambda f, e: match_episodes(e, f), sources, args.repeat)
+    print(f"\nGain : x{naive / cold:.1f} (cache vide), x{naive / warm:.1f} (cache chaud)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Copie des deux matchers remplacés par fkstream.utils.matcher, conservée comme référence.
+
+- stream_find_best_file : fkstream/utils/stream_utils.find_best_file_for_episode (table de correspondance de /stream)
+- playback_find_best_file : fkstream/utils/general.find_best_file_for_episode (choix du fichier à la lecture)
+
+Le code est repris tel quel, aux différences près nécessaires hors de l'application :
+pas de Request ni de logs, la liste de renommage est passée en paramètre,
+et les fonctions retournent l'index du fichier plutôt que le dictionnaire.
+"""
+import re
+import unicodedata
+from typing import Optional, Sequence
+
+from fkstream.utils.general import is_video
+
+
+# --- fkstream/utils/stream_utils.py ---
+
+def _normalize_filename_for_matching(filename: str) -> str:
+    """
+    Normalise une chaîne de caractères pour une comparaison flexible.
+    """
+    if not filename:
+        return ''
+
+    base = filename.lower()
+    base = unicodedata.normalize('NFD', base).encode('ascii', 'ignore').decode('utf-8')
+
+    # Supprime les métadonnées courantes
+    base = re.sub(r'\[.*?\]|\(.*?\)', '', base)
+    base = re.sub(r'\b\d{3,4}p\b', '', base)
+    base = re.sub(r'.(mkv|mp4|avi|nfo)(?=\s|$)', '', base, flags=re.IGNORECASE, count=0)
+    base = re.sub(r'\b(multi|vo|vf|vostfr|x264|x265|hevc|bdrip|webrip|dvdrip)\b', '', base)
+
+    # Nettoyage final
+    base = re.sub(r'[.\-_|\']', ' ', base)
+
+    base = re.sub(r'\b(\d+)\s*x\s*(\d+)\b', r' \2 ', base)
+
+    # Supprime les zéros non significatifs (ex: "02" -> "2")
+    base = re.sub(r'\b0+(\d+)\b', r'\1', base)
+
+    return ' '.join(base.split()).strip()
+
+
+def stream_find_best_file(files_in_torrent: Sequence[str], nfo_filename: str, rename_map: Optional[dict] = None) -> Optional[int]:
+    """
+    Trouve le fichier le plus pertinent en utilisant une stratégie de matching en 3 étapes.
+    """
+    if not nfo_filename:
+        return None
+
+    base_nfo_name = nfo_filename.rsplit('.nfo', 1)[0]
+
+    # Étape 1: Match Exact
+    for index, file_title in enumerate(files_in_torrent):
+        if not file_title.lower().endswith(('.mkv', '.mp4', '.avi')):
+            continue
+
+        base_file_name = file_title.split('/')[-1].rsplit('.', 1)[0]
+        if base_nfo_name == base_file_name:
+            return index
+
+    # Étape 2: Match Normalisé
+    normalized_nfo = _normalize_filename_for_matching(base_nfo_name)
+    for index, file_title in enumerate(files_in_torrent):
+        if not file_title.lower().endswith(('.mkv', '.mp4', '.avi')):
+            continue
+
+        base_file_name = file_title.split('/')[-1].rsplit('.', 1)[0]
+        normalized_file = _normalize_filename_for_matching(base_file_name)
+        if normalized_nfo == normalized_file:
+            return index
+
+    # Étape 3: Match avec liste de renommage
+    if rename_map:
+        for index, file_title in enumerate(files_in_torrent):
+            if not file_title.lower().endswith(('.mkv', '.mp4', '.avi')):
+                continue
+
+            base_file_name = file_title.split('/')[-1].rsplit('.', 1)[0]
+
+            if base_file_name in rename_map:
+                renamed_file = rename_map[base_file_name]
+                if renamed_file == base_nfo_name:
+                    return index
+
+    return None
+
+
+# --- fkstream/utils/general.py ---
+
+def apply_renaming(title: str, rename_map: dict) -> str:
+    """
+    Applique les règles de renommage à un titre si une correspondance est trouvée.
+    La correspondance se fait sur le titre sans son extension de fichier.
+    """
+    title_no_ext = title.rsplit('.', 1)[0] if '.' in title else title
+
+    if title_no_ext in rename_map:
+        return rename_map[title_no_ext]
+    return title
+
+
+def normalize_for_comparison(title: str) -> str:
+    """
+    Normalisation d'un titre pour la comparaison (dernière méthode de recherche)
+    """
+    if not title:
+        return ""
+
+    # Étape 1: Extraire seulement le nom du fichier
+    if '/' in title or '\\' in title:
+        title = title.replace('\\', '/').split('/')[-1]
+
+    # Étape 2: Enlever l'extension
+    title = title.rsplit('.', 1)[0]
+
+    # Étape 3: Passage en minuscules et suppression des accents
+    title = title.lower()
+    nfkd_form = unicodedata.normalize('NFKD', title)
+    title = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+
+    # Étape 4: Supprime le contenu entre crochets et parenthèses
+    title = re.sub(r'\[.*?\]|\(.*?\)', '', title)
+
+    # Étape 5: Supprimer les termes de qualité vidéo et autres "bruits"
+    noise = [
+        '1080p', '720p', '480p', 'bdrip', 'multi', 'vostfr', 'vf2', 'vf', 'x264',
+        'x265', 'hevc', 'bluray', 'web-dl', 'webrip', 'hdlight', 'dvdrip', 'remux',
+        'fan-cut', 'henshu', 'film', 'kai', 'yabai'
+    ]
+    noise_pattern = r'\b(' + '|'.join(re.escape(term) for term in noise) + r')\b'
+    title = re.sub(noise_pattern, '', title, flags=re.IGNORECASE)
+
+    # Étape 6: Remplace les séparateurs et apostrophes par des espaces
+    title = re.sub(r'[.\-_'']', ' ', title)
+
+    # Étape 7: Normaliser les numéros (ex: 01 -> 1)
+    title = re.sub(r'\b0+(\d+)\b', r'\1', title)
+
+    # Étape 8: Remplacer les espaces multiples par un seul et nettoyer les bords
+    title = re.sub(r'\s+', ' ', title).strip()
+
+    return title
+
+
+def playback_find_best_file(files: Sequence[str], nfo_filename: str, rename_map: Optional[dict] = None) -> Optional[int]:
+    """
+    Trouve le fichier correspondant à un épisode en utilisant une logique de correspondance multi étapes
+    1. Correspondance exacte (rapide).
+    2. Correspondance normalisée (robuste).
+    3. Si aucune correspondance, applique les règles de renommage et réessaye l'étape 2.
+    """
+    if not nfo_filename:
+        return None
+
+    target_filename_base = nfo_filename[:-4] if nfo_filename.lower().endswith('.nfo') else nfo_filename
+
+    # --- Étape 1: Correspondance exacte ---
+    for i, filename in enumerate(files):
+        if not filename or not is_video(filename):
+            continue
+
+        filename_no_ext = filename.rsplit('.', 1)[0]
+        if target_filename_base.lower() == filename_no_ext.lower():
+            return i
+
+    # --- Étape 2: Correspondance normalisée ---
+    normalized_target = normalize_for_comparison(target_filename_base)
+
+    for i, filename in enumerate(files):
+        if not filename or not is_video(filename):
+            continue
+
+        normalized_filename = normalize_for_comparison(filename)
+        if normalized_target == normalized_filename:
+            return i
+
+    # --- Étape 3: Renommage et nouvelle tentative de correspondance normalisée ---
+    renamed_target_base = apply_renaming(target_filename_base, rename_map or {})
+    if renamed_target_base == target_filename_base:
+        return None
+
+    normalized_renamed_target = normalize_for_comparison(renamed_target_base)
+
+    for i, filename in enumerate(files):
+        if not filename or not is_video(filename):
+            continue
+
+        normalized_filename = normalize_for_comparison(filename)
+        if normalized_renamed_target == normalized_filename:
+            return i
+
+    return None
@@ -1,32 +1,32 @@
+import os
+from typing import Optional
+
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from urllib.parse import quote, urlparse, parse_qs
-from datetime import datetime
 
 from fkstream.utils.models import settings, web_config, Episode
 from fkstream.utils.config_validator import config_check
 from fkstream.debrid.manager import get_debrid_extension
-from fkstream.scrapers.fankai import FankaiAPI, get_or_fetch_anime_details
+from fkstream.scrapers.fankai import FankaiAPI, get_or_fetch_anime_details, get_or_fetch_series_list
+from fkstream.utils.catalog import MaterializedCatalog, render_catalog_body, split_genres, translate_status
 from fkstream.utils.common_logger import logger
-from fkstream.utils.database import get_metadata_from_cache, set_metadata_to_cache
+from fkstream.utils.database import get_metadata_version, metadata_l1_cache
 from fkstream.utils.dependencies import get_fankai_api
+from fkstream.utils.revalidation import metadata_revalidator
+from fkstream.utils.singleflight import singleflight_stats
 
 templates = Jinja2Templates("fkstream/templates")
 main = APIRouter()
 
 
-def _translate_status(status: str) -> str:
-    """Traduit le statut de l'anime en français."""
-    status_translations = {
-        "Continuing": "En cours",
-        "Ended": "Terminé",
-        "Unknown": None,
-        "Canceled": "Annulé",
-        "Cancelled": "Annulé",
-        "En suspens": "En suspens"
-    }
-    return status_translations.get(status, status)
+def _manifest_url(request: Request, b64config: str) -> str:
+    """Construit l'URL du manifeste de l'utilisateur."""
+    base_url = str(request.base_url).rstrip('/')
+    if b64config:
+        return f"{base_url}/{b64config}/manifest.json"
+    return f"{base_url}/manifest.json"
 
 
 def _build_genre_links(request: Request, b64config: str, genres: list) -> list:
@@ -36,13 +36,7 @@ def _build_genre_links(request: Request, b64config: str, genres: list) -> list:
     if not genres:
         return []
     genre_links = []
-    base_url = str(request.base_url).rstrip('/')
-    if b64config:
-        encoded_manifest = f"{base_url}/{b64config}/manifest.json"
-    else:
-        encoded_manifest = f"{base_url}/manifest.json"
-
-    encoded_manifest = quote(encoded_manifest, safe='')
+    encoded_manifest = quote(_manifest_url(request, b64config), safe='')
 
     for genre_name in genres:
         genre_links.append({
@@ -65,6 +59,20 @@ async def health():
     return {"status": "ok"}
 
 
+@main.get("/metrics")
+async def metrics(request: Request):
+    """Compteurs des caches en mémoire, des regroupements d'appels, des nouvelles tentatives HTTP et des disjoncteurs du worker qui répond."""
+    http_client = getattr(request.app.state, "http_client", None)
+    return {
+        "pid": os.getpid(),
+        "metadata_l1_cache": metadata_l1_cache.stats(),
+        "metadata_stale": metadata_revalidator.stats(),
+        "singleflight": singleflight_stats(),
+        "http_retries": http_client.retry_stats() if http_client else {},
+        "circuit_breakers": http_client.circuit_stats() if http_client else {},
+    }
+
+
 @main.get("/configure")
 @main.get("/{b64config}/configure")
 async def configure(request: Request):
@@ -137,7 +145,7 @@ async def manifest(request: Request, b64config: str = None, fankai_api: FankaiAP
     base_manifest["name"] = f"{settings.ADDON_NAME}{' | ' + debrid_extension if debrid_extension else ''}"
 
     try:
-        unique_genres = await extract_unique_genres(fankai_api)
+        unique_genres = await extract_unique_genres(request, fankai_api)
         base_manifest["catalogs"][0]["extra"][2]["options"] = unique_genres
         logger.info(f"📋 MANIFEST - Ajout de {len(unique_genres)} options de genre")
     except Exception as e:
@@ -146,33 +154,43 @@ async def manifest(request: Request, b64config: str = None, fankai_api: FankaiAP
     return base_manifest
 
 
-async def extract_unique_genres(fankai_api: FankaiAPI) -> list[str]:
+async def get_materialized_catalog(request: Request, fankai_api: FankaiAPI) -> Optional[MaterializedCatalog]:
     """
-    Extrait tous les genres uniques à partir des données d'anime de l'API Fankai.
-    Utilise le même cache que la liste d'animes pour la cohérence.
-    Retourne une liste triée de genres uniques.
+    Retourne le catalogue matérialisé pour la version courante du dataset et de fk:list,
+    en le reconstruisant si l'une des deux a changé. Retourne None si le dataset est vide.
     """
-    animes_data = await get_metadata_from_cache("fk:list")
+    dataset = request.app.state.dataset
+    if not dataset.api_ids:
+        return None
 
-    if not animes_data:
-        logger.debug("📦 CACHE MISS: fk:list - Recuperation depuis l'API")
-        animes_data = await fankai_api.get_all_series()
-        await set_metadata_to_cache("fk:list", animes_data)
-        logger.debug("✅ CACHE SAUVEGARDE: fk:list")
-    else:
-        logger.debug("✅ CACHE HIT: fk:list")
+    catalog_store = request.app.state.catalog_store
+    list_version = await get_metadata_version("fk:list")
+    catalog = catalog_store.get((dataset.version, list_version)) if list_version else None
 
-    unique_genres = set()
-    for anime in animes_data:
-        genres_raw = anime.get('genres', '')
-        if genres_raw:
-            genres = [g.strip() for g in genres_raw.split(',') if g.strip()]
-            unique_genres.update(genres)
+    if catalog is None:
+        animes_data = await get_or_fetch_series_list(fankai_api)
+        # Une liste expirée servie pendant son rafraîchissement garde sa version : le catalogue déjà construit est réutilisé
+        list_version = await get_metadata_version("fk:list", allow_stale=True)
+        catalog = catalog_store.get((dataset.version, list_version)) if list_version else None
 
-    sorted_genres = sorted(list(unique_genres))
+        if catalog is None:
+            # Filtrer la liste d'animes pour ne garder que ceux du dataset
+            animes_data = [anime for anime in animes_data if str(anime.get('id')) in dataset.api_ids]
+            logger.info(f"Filtrage par dataset : {len(animes_data)} animes valides à traiter.")
+            catalog = catalog_store.build((dataset.version, list_version), animes_data)
+    return catalog
 
-    logger.debug(f"🎭 GENRES - Extraction de {len(sorted_genres)} genres uniques depuis le cache")
-    return sorted_genres
+
+async def extract_unique_genres(request: Request, fankai_api: FankaiAPI) -> list[str]:
+    """
+    Retourne la liste triée des genres du catalogue, pré-calculée avec l'index du catalogue.
+    """
+    catalog = await get_materialized_catalog(request, fankai_api)
+    if catalog is None:
+        return []
+
+    logger.debug(f"🎭 GENRES - {len(catalog.genre_names)} genres uniques depuis l'index du catalogue")
+    return list(catalog.genre_names)
 
 
 @main.get("/catalog/anime/fankai_catalog.json")
@@ -185,9 +203,20 @@ async def extract_unique_genres(fankai_api: FankaiAPI) -> list[str]:
 @main.get("/{b64config}/catalog/anime/fankai_catalog/search={search}&genre={genre}.json")
 @main.get("/catalog/anime/fankai_catalog/sort={sort}.json")
 @main.get("/{b64config}/catalog/anime/fankai_catalog/sort={sort}.json")
-async def fankai_catalog(request: Request, b64config: str = None, search: str = None, genre: str = None, sort: str = None, fankai_api: FankaiAPI = Depends(get_fankai_api)):
+@main.get("/catalog/anime/fankai_catalog/skip={skip:int}.json")
+@main.get("/{b64config}/catalog/anime/fankai_catalog/skip={skip:int}.json")
+@main.get("/catalog/anime/fankai_catalog/search={search}&skip={skip:int}.json")
+@main.get("/{b64config}/catalog/anime/fankai_catalog/search={search}&skip={skip:int}.json")
+@main.get("/catalog/anime/fankai_catalog/genre={genre}&skip={skip:int}.json")
+@main.get("/{b64config}/catalog/anime/fankai_catalog/genre={genre}&skip={skip:int}.json")
+@main.get("/catalog/anime/fankai_catalog/search={search}&genre={genre}&skip={skip:int}.json")
+@main.get("/{b64config}/catalog/anime/fankai_catalog/search={search}&genre={genre}&skip={skip:int}.json")
+@main.get("/catalog/anime/fankai_catalog/sort={sort}&skip={skip:int}.json")
+@main.get("/{b64config}/catalog/anime/fankai_catalog/sort={sort}&skip={skip:int}.json")
+async def fankai_catalog(request: Request, b64config: str = None, search: str = None, genre: str = None, sort: str = None, skip: int = 0, fankai_api: FankaiAPI = Depends(get_fankai_api)):
     """
     Fournit le catalogue d'animes en filtrant par le dataset local.
+    Les résultats sont paginés par pages de CATALOG_PAGE_SIZE via l'extra "skip" de Stremio.
     """
     if not search and "search" in request.query_params:
         search = request.query_params.get("search")
@@ -195,34 +224,20 @@ async def fankai_catalog(request: Request, b64config: str = None, search: str =
         genre = request.query_params.get("genre")
     if not sort and "sort" in request.query_params:
         sort = request.query_params.get("sort")
+    if not skip and "skip" in request.query_params:
+        try:
+            skip = int(request.query_params.get("skip"))
+        except ValueError:
+            skip = 0
 
-    logger.info(f"🔍 CATALOG - Catalogue Fankai demandé, recherche: {search}, genre: {genre}, tri: {sort}")
-
-
-    # 1. Obtenir la liste des api_id autorisés depuis le dataset
-    dataset_animes = request.app.state.dataset.get('top', [])
-    available_api_ids = {str(anime.get('api_id')) for anime in dataset_animes}
+    logger.info(f"🔍 CATALOG - Catalogue Fankai demandé, recherche: {search}, genre: {genre}, tri: {sort}, skip: {skip}")
 
-    if not available_api_ids:
+    # Le catalogue est matérialisé par (version du dataset, version de fk:list)
+    catalog = await get_materialized_catalog(request, fankai_api)
+    if catalog is None:
         logger.warning("Le dataset est vide ou ne contient aucun api_id. Le catalogue sera vide.")
         return {"metas": []}
 
-    animes_data = await get_metadata_from_cache("fk:list")
-
-    if animes_data:
-        logger.debug("✅ CACHE HIT: fk:list")
-    else:
-        logger.debug("📦 CACHE MISS: fk:list - Recuperation depuis l'API")
-        animes_data = await fankai_api.get_all_series()
-        await set_metadata_to_cache("fk:list", animes_data)
-        
-        
-    # 2. Filtrer la liste d'animes (du cache ou de l'API) pour ne garder que ceux du dataset
-    animes_data = [anime for anime in animes_data if str(anime.get('id')) in available_api_ids]
-    logger.info(f"Filtrage par dataset : {len(animes_data)} animes valides à traiter.")
-
-
-
     config = config_check(b64config)
     
     # Mapping des noms d'affichage vers les clés internes
@@ -237,95 +252,23 @@ async def fankai_catalog(request: Request, b64config: str = None, search: str =
     
     logger.info(f"Tri du catalogue par: {sort_by}")
 
-    def get_sort_value(anime, key):
-        val = anime.get(key)
-        if val is None:
-            if key in ['rating_value', 'year']: return -1
-            if key == 'last_update': return datetime.min
-            return ""
-        if key in ['rating_value', 'year']:
-            try: return float(val)
-            except (ValueError, TypeError): return -1
-        if key == 'last_update':
-            try: return datetime.fromisoformat(str(val).replace(" ", "T"))
-            except (ValueError, TypeError): return datetime.min
-        return val
-
-    reverse = sort_by != 'title'
-    animes_data.sort(key=lambda x: get_sort_value(x, sort_by), reverse=reverse)
-
-    metas = []
-    for anime in animes_data:
-        anime_title = anime.get('title', '')
-        genres_raw = anime.get('genres', '')
-        genres = [g.strip() for g in genres_raw.split(',') if g.strip()] if genres_raw else []
-
-        if search and search.lower() not in anime_title.lower():
-            continue
-
-        if genre and genre not in genres:
-            continue
-
-
-        genre_links = _build_genre_links(request, b64config, genres)
-        imdb_links = []
-        if anime.get('imdb_id'):
-            rating_display = str(anime.get('rating_value')) if anime.get('rating_value') else "N/A"
-            imdb_links.append({
-                "name": rating_display,
-                "category": "imdb",
-                "url": f"https://imdb.com/title/{anime.get('imdb_id')}"
-            })
-
-        meta = {
-            "id": f"fk:{anime.get('id')}",
-            "type": "anime",
-            "logo": anime.get('logo_image'),
-            "name": anime_title,
-            "poster": anime.get('poster_image'),
-            "posterShape": "poster",
-            "genres": genres,
-            "imdbRating": str(anime.get('rating_value')) if anime.get('rating_value') else None,
-            "releaseInfo": str(anime.get('year')) if anime.get('year') else None,
-            "runtime": _translate_status(anime.get('status')) if anime.get('status') else None,
-            "imdb_id": anime.get('imdb_id'),
-            "description": anime.get('plot', '') or "Aucune description disponible",
-            "links": genre_links + imdb_links,
-        }
-        
-        # Ajout du trailer si disponible
-        trailer_url = anime.get("trailer_url")
-        if trailer_url:
-            logger.debug(f"TRAILER - URL de bande-annonce trouvee: {trailer_url}")
-            if "youtube" in trailer_url:
-                try:
-                    parsed_url = urlparse(trailer_url)
-                    query_params = parse_qs(parsed_url.query)
-                    video_id = query_params.get("video_id", query_params.get("v", [None]))[0]
-
-                    if video_id:
-                        meta['trailers'] = [{"source": video_id, "type": "Trailer"}]
-                        logger.debug(f"TRAILER - Ajout de la propriete 'trailers' au meta-objet: {meta['trailers']}")
-                    else:
-                        logger.warning(f"TRAILER - Impossible d'extraire le video_id de l'URL: {trailer_url}")
-                except Exception as e:
-                    logger.warning(f"TRAILER - Impossible de parser l'URL de la bande-annonce '{trailer_url}': {e}")
-            else:
-                logger.warning(f"TRAILER - L'URL de la bande-annonce n'est pas une URL YouTube: {trailer_url}")
-        else:
-            logger.debug(f"TRAILER - Pas de 'trailer_url' trouve pour l'anime {anime.get('id')}.")
-        metas.append(meta)
+    display = config.get("catalogDisplay", "full")
+    if search:
+        scores = await request.app.state.catalog_search.search(catalog, request.app.state.dataset, search)
+        body, count = catalog.select_ranked(scores, sort_by, genre, skip, display)
+    else:
+        body, count = catalog.select(sort_by, genre, skip, display)
 
     if search and genre:
-        logger.info(f"🔍 CATALOG - Recherche '{search}' + Genre '{genre}': {len(metas)} animes trouves")
+        logger.info(f"🔍 CATALOG - Recherche '{search}' + Genre '{genre}': {count} animes trouves")
     elif search:
-        logger.info(f"🔍 CATALOG - Recherche '{search}': {len(metas)} animes trouves")
+        logger.info(f"🔍 CATALOG - Recherche '{search}': {count} animes trouves")
     elif genre:
-        logger.info(f"🎭 CATALOG - Genre '{genre}': {len(metas)} animes trouves")
+        logger.info(f"🎭 CATALOG - Genre '{genre}': {count} animes trouves")
     else:
-        logger.info(f"🔍 CATALOG - Retour de tous les {len(metas)} animes valides")
+        logger.info(f"🔍 CATALOG - Retour de tous les {count} animes valides")
 
-    return {"metas": metas}
+    return Response(content=render_catalog_body(body, _manifest_url(request, b64config)), media_type="application/json")
 
 
 def _validate_anime_id(anime_id: str) -> bool:
@@ -372,7 +315,7 @@ async def fankai_meta(request: Request, id: str, b64config: str = None, fankai_a
         "background": anime_data.get('fanart_image'),
         "imdbRating": str(anime_data.get('rating_value')) if anime_data.get('rating_value') else None,
         "releaseInfo": str(anime_data.get('year')) if anime_data.get('year') else None,
-        "runtime": _translate_status(anime_data.get('status')) if anime_data.get('status') else None,
+        "runtime": translate_status(anime_data.get('status')) if anime_data.get('status') else None,
         "imdb_id": anime_data.get('imdb_id'),
         "description": anime_data.get('plot'),
         "behaviorHints": {
@@ -427,8 +370,7 @@ async def fankai_meta(request: Request, id: str, b64config: str = None, fankai_a
     meta['videos'] = videos
 
     # Add links
-    genres_raw = anime_data.get('genres', '')
-    genres = [g.strip() for g in genres_raw.split(',') if g.strip()] if genres_raw else []
+    genres = split_genres(anime_data.get('genres', ''))
     meta['genres'] = genres
     
     genre_links = _build_genre_links(request, b64config, genres)
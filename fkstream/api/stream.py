@@ -1,5 +1,4 @@
 # fkstream/api/stream.py
-import re
 from urllib.parse import quote
 
 from fastapi import APIRouter, Depends, Request
@@ -11,18 +10,25 @@ from fkstream.utils.dependencies import get_fankai_api
 from fkstream.utils.general import b64_encode
 from fkstream.utils.config_validator import config_check
 from fkstream.utils.models import Anime, Episode
-from fkstream.utils.stream_utils import (bytes_to_size,
-                                         find_best_file_for_episode)
+from fkstream.utils.stream_utils import bytes_to_size
 from fkstream.utils.magnet_store import store_magnet_link
 
 from fastapi.responses import RedirectResponse, FileResponse
 from fkstream.utils.general import get_client_ip, b64_decode
 from fkstream.debrid.stremthru import StremThru
 from fkstream.debrid.manager import build_stremthru_token
+from fkstream.debrid.playback_cache import playback_resolution_cache
+from fkstream.debrid.magnet_jobs import magnet_job_manager
+from fkstream.utils.database import get_debrid_from_cache
+from fkstream.utils.deadline import DeadlineExceeded, reserve, with_deadline
+from fkstream.utils.models import settings
 
 # --- Définition du routeur ---
 streams = APIRouter()
 
+# Part du budget de /stream gardée pour construire la réponse après la vérification de disponibilité (secondes)
+STREAM_RESPONSE_RESERVE = 0.5
+
 
 async def _parse_media_id(media_id: str):
     """Analyse et valide le format du media_id."""
@@ -113,9 +119,12 @@ def _create_stream_item(request: Request, b64config: str, debrid_service: str, d
 
 @streams.get("/stream/{media_type}/{media_id}.json")
 @streams.get("/{b64config}/stream/{media_type}/{media_id}.json")
+@with_deadline(settings.STREAM_DEADLINE)
 async def stream(request: Request, media_type: str, media_id: str, b64config: str = None, fankai_api: FankaiAPI = Depends(get_fankai_api)):
     """
     Fournit les flux de streaming en vérifiant la disponibilité debrid au préalable.
+    Tout tient dans STREAM_DEADLINE : une fois le budget épuisé, les flux déjà trouvés sont renvoyés,
+    marqués ❓ si leur disponibilité n'a pas pu être vérifiée à temps.
     """
     config = config_check(b64config)
     if not config:
@@ -125,35 +134,34 @@ async def stream(request: Request, media_type: str, media_id: str, b64config: st
     if not anime_id or not episode_id:
         return {"streams": []}
 
-    anime_info, selected_episode = await _fetch_anime_and_episode_data(fankai_api, anime_id, episode_id, media_id)
+    try:
+        anime_info, selected_episode = await _fetch_anime_and_episode_data(fankai_api, anime_id, episode_id, media_id)
+    except DeadlineExceeded:
+        logger.warning(f"⌛ Metadonnees de {media_id} indisponibles dans le temps imparti")
+        return {"streams": []}
     if not anime_info or not selected_episode:
         return {"streams": []}
     
-    dataset = request.app.state.dataset.get('top', [])
-    target_anime_data = next((item for item in dataset if str(item.get('api_id')) == anime_id), None)
+    target_anime_data = request.app.state.dataset.get(anime_id)
 
     if not target_anime_data:
         logger.warning(f"Anime avec api_id {anime_id} non trouvé dans le dataset local.")
         return {"streams": []}
 
-    logger.info(f"Anime trouvé dans dataset: '{target_anime_data.get('name')}' pour épisode '{selected_episode.name}'")
+    logger.info(f"Anime trouvé dans dataset: '{target_anime_data.name}' pour épisode '{selected_episode.name}'")
     
-    all_torrents_info = []
-    hashes_to_check = []
-    for source in target_anime_data.get('sources', []):
-        magnet = source.get('magnet')
-        info_hash_match = re.search(r'btih:([a-fA-F0-9]{40})', magnet)
-        if magnet and info_hash_match:
-            hash_val = info_hash_match.group(1).lower()
-            # Stocker le magnet complet avec trackers pour éviter l'utilisation du magnet de secours
-            store_magnet_link(hash_val, magnet)
-            all_torrents_info.append({
-                "source": source,
-                "hash": hash_val
-            })
-            hashes_to_check.append(hash_val)
+    for source in target_anime_data.sources:
+        # Stocker le magnet complet avec trackers pour éviter l'utilisation du magnet de secours
+        store_magnet_link(source.hash, source.magnet)
+
+    # Les correspondances épisode -> fichier sont calculées une fois par version du dataset
+    episode_matches = request.app.state.match_table.get_matches(
+        request.app.state.dataset.version, target_anime_data, anime_info.videos, selected_episode.id
+    )
+    hashes_to_check = list(dict.fromkeys(match.hash for match in episode_matches))
 
     if not hashes_to_check:
+        logger.warning(f"Aucun stream n'a pu être généré pour {media_id} depuis le dataset.")
         return {"streams": []}
 
 
@@ -171,48 +179,43 @@ async def stream(request: Request, media_type: str, media_id: str, b64config: st
         tracker_map = {h: 'dataset' for h in hashes_to_check}
         sources_map = {h: {"filename": "..."} for h in hashes_to_check}
 
-        availability_results = await debrid_instance.get_availability(hashes_to_check, seeders_map, tracker_map, sources_map)
+        try:
+            with reserve(STREAM_RESPONSE_RESERVE):
+                availability_results = await debrid_instance.get_availability(hashes_to_check, seeders_map, tracker_map, sources_map)
+        except DeadlineExceeded:
+            logger.warning(f"⌛ Disponibilite non verifiee a temps pour {media_id}, flux renvoyes avec le statut inconnu")
+            availability_results = []
         status_map = {result['hash']: result['status'] for result in availability_results}
 
     streams_list = []
-    for torrent_info in all_torrents_info:
-        source = torrent_info["source"]
-        hash_val = torrent_info["hash"]
-        files_in_torrent = source.get('files', [])
-
-        files_for_matching = [{"title": f} for f in files_in_torrent]
-        best_file = await find_best_file_for_episode(request, files_for_matching, selected_episode)
-
-        if best_file:
-            try:
-                file_index = files_in_torrent.index(best_file['title'])
-                
-                torrent_data = {
-                    'infoHash': hash_val,
-                    'title': best_file['title'],
-                    'fileIndex': file_index,
-                    'size': source.get('size', 0),
-                    'seeders': source.get('seeders')
-                }
-                
-                # Parce que les emojis, c'est cool
-                status = status_map.get(hash_val, 'unknown')
-                if status == "cached":
-                    debrid_emoji = "⚡"
-                elif status == "magnet":
-                    debrid_emoji = "🧲"
-                elif status in ["downloading", "queued"]:
-                    debrid_emoji = "⬇️"
-                else:
-                    debrid_emoji = "❓"
-                
-                stream_item = _create_stream_item(request, b64config, debrid_service, debrid_emoji, torrent_data, media_id)
-                streams_list.append(stream_item)
-
-
-            except (ValueError, AttributeError) as e:
-                logger.error(f"Erreur lors de la création du stream pour '{best_file['title']}': {e}")
-                continue
+    for match in episode_matches:
+        hash_val = match.hash
+        try:
+            torrent_data = {
+                'infoHash': hash_val,
+                'title': match.filename,
+                'fileIndex': match.file_index,
+                'size': match.size,
+                'seeders': match.seeders
+            }
+            
+            # Parce que les emojis, c'est cool
+            status = status_map.get(hash_val, 'unknown')
+            if status == "cached":
+                debrid_emoji = "⚡"
+            elif status == "magnet":
+                debrid_emoji = "🧲"
+            elif status in ["downloading", "queued"]:
+                debrid_emoji = "⬇️"
+            else:
+                debrid_emoji = "❓"
+            
+            stream_item = _create_stream_item(request, b64config, debrid_service, debrid_emoji, torrent_data, media_id)
+            streams_list.append(stream_item)
+
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Erreur lors de la création du stream pour '{match.filename}': {e}")
+            continue
 
     if not streams_list:
         logger.warning(f"Aucun stream n'a pu être généré pour {media_id} depuis le dataset.")
@@ -242,32 +245,45 @@ async def playback(request: Request, b64config: str, b64_media_id: str, hash_val
         logger.error(f"Impossible d'analyser l'ID de l'anime/épisode depuis {real_media_id}")
         return FileResponse("fkstream/assets/uncached.mp4", media_type="video/mp4")
 
+    debrid_instance = StremThru(
+        session=request.app.state.http_client,
+        video_id=real_media_id,
+        media_only_id=media_only_id,
+        token=build_stremthru_token(config["debridService"], config["debridApiKey"]),
+        ip=get_client_ip(request)
+    )
+
+    # Reprise ou déplacement dans la vidéo : lien déjà résolu, redirection sans autre appel
+    cached_link = playback_resolution_cache.get_link((debrid_instance.token_hash, hash_val.lower(), str(file_index)))
+    if cached_link:
+        logger.info(f"⚡ Redirection depuis le cache de resolution pour {filename}")
+        return RedirectResponse(cached_link, status_code=302)
+
     #! On récupère les détails complets de l'épisode pour avoir la saison et le numéro
     fankai_api = FankaiAPI(request.app.state.http_client)
-    _, selected_episode = await _fetch_anime_and_episode_data(fankai_api, anime_id, episode_id, real_media_id)
+    anime_info, selected_episode = await _fetch_anime_and_episode_data(fankai_api, anime_id, episode_id, real_media_id)
 
     if not selected_episode:
         logger.error(f"Impossible de récupérer les détails de l'épisode pour {real_media_id}")
         return FileResponse("fkstream/assets/uncached.mp4", media_type="video/mp4")
 
-    http_client = request.app.state.http_client #
-    client_ip = get_client_ip(request) #
-    stremthru_token = build_stremthru_token(config["debridService"], config["debridApiKey"]) #
-    
-    debrid_instance = StremThru(
-        session=http_client,
-        video_id=real_media_id,
-        media_only_id=media_only_id,
-        token=stremthru_token,
-        ip=client_ip
-    )
-    
+    # Le nom du fichier attendu provient de la table de correspondance plutôt que de l'URL
+    torrent_name = filename
+    target_anime_data = request.app.state.dataset.get(anime_id)
+    if target_anime_data:
+        episode_matches = request.app.state.match_table.get_matches(
+            request.app.state.dataset.version, target_anime_data, anime_info.videos, selected_episode.id
+        )
+        match = next((m for m in episode_matches if m.hash == hash_val.lower() and m.file_index == file_index), None)
+        if match:
+            torrent_name = match.filename.split('/')[-1]
+
     logger.info(f"Appel de generate_download_link pour S{selected_episode.season_number}E{selected_episode.number}")
     download_url = await debrid_instance.generate_download_link(
         hash=hash_val,
         index=str(file_index),
         name=filename,
-        torrent_name=filename,
+        torrent_name=torrent_name,
         season=selected_episode.season_number,
         episode=selected_episode.number
     )
@@ -279,3 +295,24 @@ async def playback(request: Request, b64config: str, b64_media_id: str, hash_val
         # Si le lien n'est pas disponible (en cours de DL ou erreur), on affiche la vidéo d'attente
         logger.warning(f"Affichage de la vidéo d'attente pour {filename} (téléchargement en cours ou erreur).")
         return FileResponse("fkstream/assets/uncached.mp4", media_type="video/mp4", status_code=200)
+
+
+@streams.get("/{b64config}/playback/status/{hash_val}")
+async def playback_status(b64config: str, hash_val: str):
+    """
+    État léger d'un magnet : disponibilité en cache et suivi en arrière-plan éventuel,
+    sans aucun appel au service debrid.
+    """
+    config = config_check(b64config)
+    if not config or config.get("debridService") == "torrent":
+        return {"hash": hash_val, "availability": None, "job": None}
+
+    debrid_service = config["debridService"]
+    cached = await get_debrid_from_cache(hash_val.lower(), debrid_service)
+    job = await magnet_job_manager.status(hash_val, debrid_service)
+    return {
+        "hash": hash_val,
+        "debrid_service": debrid_service,
+        "availability": cached["status"] if cached else None,
+        "job": job,
+    }
@@ -0,0 +1,75 @@
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import get_account_status_from_cache, save_account_status_to_cache
+from fkstream.utils.models import settings
+from fkstream.utils.singleflight import SingleFlight
+
+# Nombre d'entrées en mémoire au-delà duquel les entrées expirées sont purgées
+_MAX_LOCAL_ENTRIES = 4096
+
+
+def token_fingerprint(token: str) -> str:
+    """Empreinte d'un jeton debrid : le jeton lui-même n'est jamais stocké."""
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+
+class PremiumStatusCache:
+    """
+    Cache du statut premium par compte debrid (empreinte du jeton), en mémoire puis en base.
+    Les vérifications simultanées d'un même compte sont regroupées en un seul appel.
+    Les échecs de vérification ne sont pas mis en cache.
+    """
+
+    def __init__(self, premium_ttl: int, non_premium_ttl: int):
+        self.premium_ttl = premium_ttl
+        self.non_premium_ttl = non_premium_ttl
+        self._entries: Dict[str, Tuple[bool, float]] = {}
+        self._flight = SingleFlight("premium_status")
+
+    def _remember(self, token_hash: str, is_premium: bool, expires_at: float) -> None:
+        if len(self._entries) >= _MAX_LOCAL_ENTRIES:
+            now = time.time()
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+        self._entries[token_hash] = (is_premium, expires_at)
+
+    async def _resolve(self, token_hash: str, fetch: Callable[[], Awaitable[Optional[bool]]]) -> bool:
+        try:
+            cached = await get_account_status_from_cache(token_hash)
+        except Exception as e:
+            logger.warning(f"Lecture du statut premium en cache impossible: {e}")
+            cached = None
+        if cached is not None:
+            self._remember(token_hash, *cached)
+            return cached[0]
+
+        is_premium = await fetch()
+        if is_premium is None:
+            return False
+
+        ttl = self.premium_ttl if is_premium else self.non_premium_ttl
+        self._remember(token_hash, is_premium, time.time() + ttl)
+        try:
+            await save_account_status_to_cache(token_hash, is_premium, ttl)
+        except Exception as e:
+            logger.warning(f"Ecriture du statut premium en cache impossible: {e}")
+        return is_premium
+
+    async def get_or_check(self, token_hash: str, fetch: Callable[[], Awaitable[Optional[bool]]]) -> bool:
+        """
+        Retourne le statut premium du compte. `fetch` interroge le service debrid
+        et retourne True/False, ou None en cas d'échec.
+        """
+        entry = self._entries.get(token_hash)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        return await self._flight.do(token_hash, lambda: self._resolve(token_hash, fetch))
+
+
+premium_status_cache = PremiumStatusCache(
+    premium_ttl=settings.PREMIUM_STATUS_TTL,
+    non_premium_ttl=settings.DEBRID_NEGATIVE_TTL,
+)
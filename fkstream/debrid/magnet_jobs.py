@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import PROCESS_ID, claim_magnet_job, get_magnet_job, save_debrid_to_cache, update_magnet_job
+from fkstream.utils.deadline import detach
+
+# Délai avant la première vérification, doublé à chaque tentative jusqu'au plafond (secondes)
+MAGNET_JOB_BASE_DELAY = 2
+MAGNET_JOB_MAX_DELAY = 60
+# Durée maximale de suivi d'un magnet avant abandon
+MAGNET_JOB_MAX_DURATION = 30 * 60
+# Marge du bail en base au-delà de la prochaine vérification : passé ce délai, un autre worker peut reprendre la tâche
+MAGNET_JOB_LEASE = 60
+
+# Statuts StremThru qui terminent le suivi
+READY_STATUSES = {"cached", "downloaded"}
+FAILED_STATUSES = {"failed", "invalid"}
+
+JobKey = Tuple[str, str]  # (hash, service debrid)
+MagnetCheck = Callable[[], Awaitable[Optional[str]]]
+
+
+class MagnetJobManager:
+    """
+    Suivi en arrière-plan des magnets en cours de téléchargement, à la place de l'attente dans /playback.
+    Une seule tâche par (hash, service debrid) : localement via le dictionnaire des tâches,
+    et entre workers via une réservation avec bail dans la table magnet_jobs.
+    Les vérifications s'espacent de façon exponentielle ; à la fin, le cache de disponibilité est mis à jour.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, max_duration: float, lease: float):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_duration = max_duration
+        self.lease = lease
+        self._jobs: Dict[JobKey, asyncio.Task] = {}
+        self._claiming: Set[JobKey] = set()
+
+    def delay(self, attempt: int) -> float:
+        """Délai avant la vérification numéro `attempt` (à partir de 0)."""
+        return min(self.max_delay, self.base_delay * (2 ** attempt))
+
+    async def schedule(self, hash: str, debrid_service: str, check: MagnetCheck) -> bool:
+        """
+        Démarre le suivi du magnet s'il n'est pas déjà suivi par ce worker ou un autre.
+        `check` interroge le service debrid et retourne le statut StremThru du magnet, ou None en cas d'échec.
+        Retourne True si le magnet est suivi (par ce worker ou un autre).
+        """
+        key = (hash.lower(), debrid_service)
+        if key in self._jobs or key in self._claiming:
+            return True
+
+        self._claiming.add(key)
+        try:
+            claimed = await claim_magnet_job(key[0], debrid_service, PROCESS_ID, self.base_delay + self.lease)
+        except Exception as e:
+            logger.warning(f"Reservation du suivi du magnet {hash} impossible: {e}")
+            return False
+        finally:
+            self._claiming.discard(key)
+
+        if not claimed:
+            logger.info(f"🔁 Magnet {hash} deja suivi par un autre worker")
+            return True
+
+        logger.info(f"🛰️ Suivi en arriere-plan demarre pour le magnet {hash} ({debrid_service})")
+        task = asyncio.create_task(self._run(key, check))
+        self._jobs[key] = task
+        task.add_done_callback(lambda _: self._jobs.pop(key, None))
+        return True
+
+    async def _run(self, key: JobKey, check: MagnetCheck) -> None:
+        detach()
+        hash, debrid_service = key
+        started = time.time()
+        attempt = 0
+        magnet_status = None
+        status = "expired"
+        try:
+            while time.time() - started < self.max_duration:
+                delay = self.delay(attempt)
+                next_check = time.time() + delay
+                await update_magnet_job(hash, debrid_service, PROCESS_ID, "pending", magnet_status, attempt, next_check, next_check + self.lease)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+                try:
+                    magnet_status = await check()
+                except Exception as e:
+                    logger.warning(f"Verification du magnet {hash} impossible (tentative {attempt}): {e}")
+                    magnet_status = None
+                logger.info(f"🛰️ Magnet {hash}: statut {magnet_status} (tentative {attempt})")
+
+                if magnet_status in READY_STATUSES:
+                    status = "ready"
+                    break
+                if magnet_status in FAILED_STATUSES:
+                    status = "failed"
+                    break
+        except asyncio.CancelledError:
+            # Arrêt du worker : le bail est libéré pour qu'un autre worker reprenne le suivi
+            await self._finish(key, "cancelled", magnet_status, attempt)
+            raise
+        except Exception as e:
+            logger.warning(f"Suivi du magnet {hash} interrompu: {e}")
+            status = "failed"
+
+        await self._finish(key, status, magnet_status, attempt)
+
+    async def _finish(self, key: JobKey, status: str, magnet_status: Optional[str], attempts: int) -> None:
+        hash, debrid_service = key
+        try:
+            await update_magnet_job(hash, debrid_service, PROCESS_ID, status, magnet_status, attempts, None, time.time())
+            if status == "ready":
+                await save_debrid_to_cache(hash, debrid_service, "cached")
+                logger.info(f"✅ Magnet {hash} pret apres {attempts} verifications, cache mis a jour")
+            elif status == "failed":
+                await save_debrid_to_cache(hash, debrid_service, "unknown")
+                logger.warning(f"❌ Telechargement du magnet {hash} en echec ({magnet_status})")
+            elif status == "expired":
+                logger.warning(f"⌛ Suivi du magnet {hash} abandonne apres {attempts} verifications")
+        except Exception as e:
+            logger.warning(f"Enregistrement de la fin du suivi du magnet {hash} impossible: {e}")
+
+    async def status(self, hash: str, debrid_service: str) -> Optional[dict]:
+        """État du suivi d'un magnet, tel qu'enregistré en base (tous workers confondus)."""
+        job = await get_magnet_job(hash.lower(), debrid_service)
+        if job is not None:
+            job["tracked_locally"] = (hash.lower(), debrid_service) in self._jobs
+        return job
+
+    async def shutdown(self) -> None:
+        """Annule les suivis en cours à l'arrêt du worker."""
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Instance globale partagée par les requêtes de lecture du worker
+magnet_job_manager = MagnetJobManager(
+    base_delay=MAGNET_JOB_BASE_DELAY,
+    max_delay=MAGNET_JOB_MAX_DELAY,
+    max_duration=MAGNET_JOB_MAX_DURATION,
+    lease=MAGNET_JOB_LEASE,
+)
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fkstream.utils.singleflight import SingleFlight
+
+# Durée de vie d'un lien direct généré, par service (secondes) : les liens expirent côté debrid
+PLAYBACK_LINK_TTLS = {
+    "realdebrid": 3600,
+    "alldebrid": 1800,
+    "premiumize": 3600,
+    "torbox": 1800,
+    "debridlink": 3600,
+    "easydebrid": 900,
+    "offcloud": 1800,
+    "pikpak": 900,
+}
+DEFAULT_PLAYBACK_LINK_TTL = 900
+
+# Durée de vie de la liste des fichiers d'un magnet : elle ne change pas tant que le torrent reste sur le compte
+PLAYBACK_FILES_TTL = 6 * 3600
+
+# Nombre maximal de résolutions gardées en mémoire
+PLAYBACK_CACHE_SIZE = 2048
+
+PlaybackKey = Tuple[str, str, str]  # (empreinte du jeton, hash, fileIndex)
+
+
+class PlaybackResolution:
+    """Résolution d'un fichier : fichiers du magnet, fichier cible et lien direct."""
+
+    __slots__ = ("files", "target_file", "files_expires_at", "link", "link_expires_at")
+
+    def __init__(self, files: list, target_file: dict):
+        self.files = files
+        self.target_file = target_file
+        self.files_expires_at = time.time() + PLAYBACK_FILES_TTL
+        self.link: Optional[str] = None
+        self.link_expires_at = 0.0
+
+
+class PlaybackResolutionCache:
+    """
+    Cache des résolutions de lecture par (empreinte du jeton, hash, fileIndex).
+    Une reprise ou un déplacement dans la vidéo est redirigé sans appeler StremThru ;
+    un lien expiré est régénéré directement depuis le fichier cible, sans repasser par le magnet.
+    Les résolutions identiques simultanées sont regroupées en une seule.
+    """
+
+    def __init__(self, max_size: int = PLAYBACK_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[PlaybackKey, PlaybackResolution]" = OrderedDict()
+        self._flight = SingleFlight("playback_resolution")
+
+    def _get(self, key: PlaybackKey) -> Optional[PlaybackResolution]:
+        resolution = self._entries.get(key)
+        if resolution is None:
+            return None
+        if resolution.files_expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return resolution
+
+    def get_link(self, key: PlaybackKey) -> Optional[str]:
+        """Lien direct encore valide, ou None."""
+        resolution = self._get(key)
+        if resolution and resolution.link and resolution.link_expires_at > time.time():
+            return resolution.link
+        return None
+
+    def get_target_file(self, key: PlaybackKey) -> Optional[dict]:
+        """Fichier cible déjà trouvé dans le magnet, ou None."""
+        resolution = self._get(key)
+        return resolution.target_file if resolution else None
+
+    def store_files(self, key: PlaybackKey, files: list, target_file: dict) -> None:
+        self._entries[key] = PlaybackResolution(files, target_file)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def store_link(self, key: PlaybackKey, link: str, debrid_service: str) -> None:
+        resolution = self._entries.get(key)
+        if resolution is None:
+            return
+        resolution.link = link
+        resolution.link_expires_at = time.time() + PLAYBACK_LINK_TTLS.get(debrid_service, DEFAULT_PLAYBACK_LINK_TTL)
+
+    def invalidate(self, key: PlaybackKey) -> None:
+        self._entries.pop(key, None)
+
+    async def single_flight(self, key: PlaybackKey, resolve: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Exécute `resolve` une seule fois pour toutes les requêtes simultanées de la même clé."""
+        return await self._flight.do(key, resolve)
+
+
+# Instance globale partagée par les requêtes de lecture du worker
+playback_resolution_cache = PlaybackResolutionCache()
@@ -4,13 +4,23 @@ from urllib.parse import unquote
 
 from RTN import parse
 from fkstream.utils.models import settings
-from fkstream.utils.general import is_video, find_best_file_for_episode
-from fkstream.utils.database import get_debrid_from_cache, save_debrid_to_cache, get_metadata_from_cache, set_metadata_to_cache
+from fkstream.utils.general import is_video
+from fkstream.utils.matcher import find_best_file
+from fkstream.utils.rename_map import rename_map_service
+from fkstream.debrid.account_status import premium_status_cache, token_fingerprint
+from fkstream.debrid.playback_cache import playback_resolution_cache
+from fkstream.debrid.magnet_jobs import magnet_job_manager
+from fkstream.utils.availability_policy import availability_policy
+from fkstream.utils.database import get_debrid_from_cache, save_debrid_to_cache, get_many_debrid_from_cache, save_many_debrid_to_cache
 from fkstream.utils.common_logger import logger
 from fkstream.utils.magnet_store import get_magnet_link
 from fkstream.utils.http_client import HttpClient
+from fkstream.utils.singleflight import SingleFlight
 from fkstream.scrapers.fankai import FankaiAPI, get_or_fetch_anime_details
 
+# Un seul /magnets/check par compte et par lot de hashes pour les /stream simultanés d'un même anime
+availability_flight = SingleFlight("stremthru_availability")
+
 
 class StremThru:
     """
@@ -32,6 +42,7 @@ class StremThru:
         self.client_ip = ip
         self.sid = video_id
         self.media_only_id = media_only_id
+        self.token_hash = token_fingerprint(f"{store}:{token}")
 
     def parse_store_creds(self, token: str):
         """Analyse les informations d'identification du magasin à partir du jeton."""
@@ -41,14 +52,18 @@ class StremThru:
         return token, ""
 
     async def check_premium(self):
-        """Vérifie si l'utilisateur a un abonnement premium."""
+        """Vérifie si l'utilisateur a un abonnement premium (mis en cache par compte)."""
+        return await premium_status_cache.get_or_check(self.token_hash, self._fetch_premium_status)
+
+    async def _fetch_premium_status(self):
+        """Interroge StremThru sur le statut premium. Retourne None en cas d'échec."""
         try:
             user_req = await self.session.get(f"{self.base_url}/user?client_ip={self.client_ip}", headers=self.default_headers)
             user = user_req.json()
             return user["data"]["subscription_status"] == "premium"
         except Exception as e:
             logger.warning(f"Exception lors de la verification du statut premium sur {self.name}: {e}")
-        return False
+        return None
 
     async def get_instant(self, magnets: list):
         """Vérifie la disponibilité instantanée d'une liste de magnets."""
@@ -75,10 +90,14 @@ class StremThru:
 
 
     async def _fetch_availability_in_chunks(self, torrent_hashes: list):
-        """Récupère la disponibilité auprès de StremThru par lots pour éviter les limites de longueur d'URL."""
+        """
+        Récupère la disponibilité auprès de StremThru par lots pour éviter les limites de longueur d'URL.
+        Les hashes sont triés pour que des demandes simultanées identiques partagent les mêmes lots.
+        """
         chunk_size = 50
+        torrent_hashes = sorted(set(torrent_hashes))
         chunks = [torrent_hashes[i:i + chunk_size] for i in range(0, len(torrent_hashes), chunk_size)]
-        tasks = [self.get_instant(chunk) for chunk in chunks]
+        tasks = [availability_flight.do((self.token_hash, tuple(chunk)), lambda chunk=chunk: self.get_instant(chunk)) for chunk in chunks]
         responses = await asyncio.gather(*tasks)
         availability = []
         for response in responses:
@@ -86,24 +105,40 @@ class StremThru:
                 availability.extend(response["data"]["items"])
         return availability
 
+    async def _read_availability_cache(self, torrent_hashes: list) -> dict:
+        """Une seule lecture groupée du cache pour tous les hashes."""
+        try:
+            return await get_many_debrid_from_cache(torrent_hashes, self.real_debrid_name)
+        except Exception as e:
+            logger.warning(f"Lecture groupee du cache de disponibilite impossible: {e}")
+            return {}
+
+    async def _get_cached_availability(self, torrent_hashes: list):
+        """
+        StremThru indisponible (disjoncteur ouvert) : statuts en cache, les autres hashes restent inconnus.
+        Ni le statut premium ni la disponibilité ne sont demandés, la réponse est immédiate.
+        """
+        cache_results = await self._read_availability_cache(torrent_hashes)
+        files = [
+            {"hash": hash, "status": cache_results[hash]["status"] if cache_results.get(hash) else "unknown", "title": "", "size": 0}
+            for hash in torrent_hashes
+        ]
+        logger.warning(f"⛔ StremThru indisponible: {len(cache_results)}/{len(torrent_hashes)} statuts servis depuis le cache, les autres restent inconnus")
+        return files
+
     async def get_availability(self, torrent_hashes: list, seeders_map: dict, tracker_map: dict, sources_map: dict):
         """Logique principale pour obtenir la disponibilité des torrents, en utilisant le cache et l'API."""
         logger.info(f"🔍 StremThru get_availability - Recherche de {len(torrent_hashes)} torrents")
+        if self.session.circuit_open(self.base_url):
+            return await self._get_cached_availability(torrent_hashes)
         if not await self.check_premium(): return []
 
         cached_files, unknown_hashes = [], []
-        
-        # Paralléliser les requêtes cache pour améliorer les performances
-        cache_tasks = [
-            get_debrid_from_cache(self.sid, hash, self.real_debrid_name) 
-            for hash in torrent_hashes
-        ]
-        cache_results = await asyncio.gather(*cache_tasks, return_exceptions=True)
-        
-        # Traiter les résultats des requêtes cache parallèles
-        for i, hash in enumerate(torrent_hashes):
-            cached_status = cache_results[i]
-            if cached_status and not isinstance(cached_status, Exception):
+        cache_results = await self._read_availability_cache(torrent_hashes)
+
+        for hash in torrent_hashes:
+            cached_status = cache_results.get(hash)
+            if cached_status:
                 status = cached_status["status"]
                 logger.info(f"✅ CACHE HIT: {hash} = {status}")
                 cached_files.append({"hash": hash, "status": status, "title": "", "size": 0})
@@ -136,35 +171,73 @@ class StremThru:
             for file_list in processed_files_list:
                 if file_list: newly_processed_files.extend(file_list)
 
-            # Préparer les écritures cache en parallèle pour améliorer les performances
-            cache_save_tasks = []
+            # Écritures cache regroupées en un seul upsert multi-lignes
+            statuses_to_save = {}
             for file_info in newly_processed_files:
                 hash = file_info["hash"]
-                api_status = file_info.get("status", "unknown")
-                db_status = "cached" if api_status == "cached" else "downloading" if api_status in ["downloading", "queued", "failed"] else None
-                if db_status:
-                    if "playback_filename" in self.sid:
-                        logger.info(f"⏩ Sauvegarde du cache ignoree pour media_id de type playback_filename: {self.sid}")
-                        file_info["status"] = db_status
-                        continue
-                    # Ajouter la tâche de sauvegarde cache à la liste
-                    cache_save_tasks.append(save_debrid_to_cache(self.sid, hash, self.real_debrid_name, db_status))
-                    logger.info(f"💾 ECRITURE BD: {hash} → {db_status}")
-                file_info["status"] = db_status or "unknown"
-            
-            # Exécuter toutes les écritures cache en parallèle
-            if cache_save_tasks:
-                await asyncio.gather(*cache_save_tasks, return_exceptions=True)
+                # Tous les statuts sont mis en cache, y compris unknown/not_cached (cache négatif à courte durée)
+                db_status = availability_policy.normalize(file_info.get("status", "unknown"))
+                file_info["status"] = db_status
+                if "playback_filename" in self.sid:
+                    logger.info(f"⏩ Sauvegarde du cache ignoree pour media_id de type playback_filename: {self.sid}")
+                    continue
+                statuses_to_save[hash] = db_status
+                logger.info(f"💾 ECRITURE BD: {hash} → {db_status}")
+
+            if statuses_to_save:
+                try:
+                    await save_many_debrid_to_cache(statuses_to_save, self.real_debrid_name)
+                except Exception as e:
+                    logger.warning(f"Ecriture groupee du cache de disponibilite impossible: {e}")
 
         final_files = cached_files + newly_processed_files
         logger.log("SCRAPER", f"{self.name}: Trouve {len(final_files)} fichiers valides au total ({len(cached_files)} en cache, {len(newly_processed_files)} nouveaux).")
         return final_files
 
     async def generate_download_link(self, hash: str, index: str, name: str, torrent_name: str, season: int, episode: int):
-        """Génère un lien de téléchargement pour un fichier spécifique d'un torrent."""
+        """
+        Génère un lien de téléchargement pour un fichier spécifique d'un torrent.
+        Un lien déjà généré pour ce compte est servi depuis le cache de résolution,
+        et les demandes identiques simultanées sont regroupées.
+        """
+        key = (self.token_hash, hash.lower(), str(index))
+        cached_link = playback_resolution_cache.get_link(key)
+        if cached_link:
+            logger.info(f"⚡ CACHE HIT: Lien direct en cache pour le hash {hash} (fichier {index})")
+            return cached_link
+        return await playback_resolution_cache.single_flight(
+            key, lambda: self._resolve_download_link(key, hash, index, name, torrent_name, season, episode)
+        )
+
+    async def _request_direct_link(self, file_link: str):
+        """Demande à StremThru le lien direct d'un fichier du magnet. Retourne None si absent."""
+        link_req = await self.session.post(f"{self.base_url}/link/generate?client_ip={self.client_ip}", json={"link": file_link}, headers=self.default_headers, idempotent=True)
+        link = link_req.json()
+        direct_link = link.get("data", {}).get("link")
+        if not direct_link:
+            logger.warning(f"⚠️ Pas de lien direct dans la reponse: {link}")
+        return direct_link
+
+    async def _resolve_download_link(self, key: tuple, hash: str, index: str, name: str, torrent_name: str, season: int, episode: int):
+        """Résolution complète : magnet, fichier cible puis lien direct, en réutilisant le fichier cible déjà trouvé."""
         try:
             logger.info(f"🎬 StremThru generate_download_link pour hash: {hash}")
-            cached_result = await get_debrid_from_cache(self.sid, hash, self.real_debrid_name)
+
+            # Lien expiré mais fichier cible connu : régénération directe, sans repasser par le magnet
+            known_file = playback_resolution_cache.get_target_file(key)
+            if known_file and known_file.get("link"):
+                try:
+                    direct_link = await self._request_direct_link(known_file["link"])
+                except Exception as e:
+                    logger.warning(f"Regeneration du lien depuis le fichier en cache impossible pour {hash}: {e}")
+                    direct_link = None
+                if direct_link:
+                    playback_resolution_cache.store_link(key, direct_link, self.real_debrid_name)
+                    logger.info(f"✅ Lien direct regenere depuis le fichier en cache pour le hash {hash}")
+                    return direct_link
+                playback_resolution_cache.invalidate(key)
+
+            cached_result = await get_debrid_from_cache(hash, self.real_debrid_name)
             cached_status = cached_result["status"] if cached_result else None
             if cached_status: logger.info(f"✅ CACHE HIT: Hash {hash} = {cached_status}")
 
@@ -173,7 +246,7 @@ class StremThru:
                 if cached_status not in ["downloading", "cached"]:
                     if "playback_filename" not in self.sid:
                         logger.info(f"🔄 ECHEC STREAMING: Le hash {hash} ne fonctionne pas ! Marque comme en telechargement")
-                        await save_debrid_to_cache(self.sid, hash, self.real_debrid_name, "downloading")
+                        await save_debrid_to_cache(hash, self.real_debrid_name, "downloading")
                         logger.info(f"⬇️ Cache mis a jour: {hash} → en telechargement")
                 return status
 
@@ -181,45 +254,32 @@ class StremThru:
             if not target_file:
                 logger.warning(f"❌ Aucun fichier cible trouve pour le hash {hash}")
                 return
+            playback_resolution_cache.store_files(key, magnet.get("data", {}).get("files", []), target_file)
 
             try:
-                link_req = await self.session.post(f"{self.base_url}/link/generate?client_ip={self.client_ip}", json={"link": target_file["link"]}, headers=self.default_headers)
-                link = link_req.json()
-                if link.get("data", {}).get("link"):
+                direct_link = await self._request_direct_link(target_file["link"])
+                if direct_link:
                     logger.info(f"✅ Lien direct genere avec succes pour le hash {hash}")
+                    playback_resolution_cache.store_link(key, direct_link, self.real_debrid_name)
                     if cached_status != "cached":
                         if "playback_filename" not in self.sid:
-                            await save_debrid_to_cache(self.sid, hash, self.real_debrid_name, "cached")
+                            await save_debrid_to_cache(hash, self.real_debrid_name, "cached")
                             logger.info(f"✅ Cache mis a jour: {hash} → en cache (streaming reussi)")
-                    return link["data"]["link"]
+                    return direct_link
                 else:
-                    logger.warning(f"⚠️ Pas de lien direct dans la reponse pour le hash {hash}: {link}")
                     raise Exception("Pas de lien direct disponible")
             except Exception as link_error:
                 logger.warning(f"❌ Echec de la generation du lien direct pour le hash {hash}: {link_error}")
                 if cached_status not in ["downloading", "cached"]:
                     if "playback_filename" not in self.sid:
                         logger.info(f"🔄 ECHEC STREAMING: Le hash {hash} ne fonctionne pas ! Marque comme en telechargement")
-                        await save_debrid_to_cache(self.sid, hash, self.real_debrid_name, "downloading")
+                        await save_debrid_to_cache(hash, self.real_debrid_name, "downloading")
                         logger.info(f"⬇️ Cache mis a jour: {hash} → en telechargement")
                 if status in ["unknown", "not_cached"]:
-                    logger.info(f"🚀 Tentative de demarrage du telechargement pour le hash {hash}")
-                    try:
-                        await asyncio.sleep(2)
-                        magnet_link = get_magnet_link(hash) or f"magnet:?xt=urn:btih:{hash}"
-                        status_check = await self.session.get(f"{self.base_url}/magnets/check?magnet={magnet_link}&client_ip={self.client_ip}&sid={self.sid}", headers=self.default_headers)
-                        status_response = status_check.json()
-                        new_status = status_response["data"]["items"][0]["status"] if status_response.get("data", {}).get("items") else "unknown"
-                        logger.info(f"🔄 Nouveau statut apres tentative de telechargement: {new_status}")
-                        if new_status == "downloading":
-                            logger.info(f"✅ Telechargement demarre pour le hash {hash}")
-                            return f"https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4#message=Telechargement en cours pour {hash[:8]}..."
-                        else:
-                            logger.warning(f"❌ Telechargement non demarre, statut: {new_status}")
-                            return None
-                    except Exception as download_error:
-                        logger.warning(f"❌ Erreur lors du demarrage du telechargement pour le hash {hash}: {download_error}")
-                        return None
+                    # Le magnet a été ajouté au compte : le suivi continue en arrière-plan, sans faire attendre la lecture
+                    logger.info(f"🚀 Telechargement demande pour le hash {hash}, suivi en arriere-plan")
+                    await self._track_magnet(hash, magnet)
+                    return None
                 else:
                     logger.warning(f"❌ Torrent suppose etre en cache mais lien indisponible pour le hash {hash}")
                     return None
@@ -237,7 +297,7 @@ class StremThru:
         for file in debrid_files:
             filename = file.get("name", "")
             if not is_video(filename) or "sample" in filename.lower(): continue
-            if filename == torrent_name: return file
+            if filename == torrent_name or filename.split("/")[-1] == torrent_name: return file
             filename_parsed = parse(filename)
             file_season = filename_parsed.seasons[0] if filename_parsed.seasons else None
             file_episode = filename_parsed.episodes[0] if filename_parsed.episodes else None
@@ -267,10 +327,8 @@ class StremThru:
                             logger.warning(f"⚠️ StremThru: Impossible de récupérer nfo_filename pour l'episode {target_episode_id}")
                             return None
                         
-                        formatted_files = [{"title": f.get("name", "").split("/")[-1], "size": f.get("size", 0), "original_file": f} for f in files_with_link]
-                        episode_info = {"nfo_filename": nfo_filename}
-                        best_file = find_best_file_for_episode(formatted_files, episode_info)
-                        if best_file: return best_file["original_file"]
+                        best_index = find_best_file([f.get("name", "") for f in files_with_link], nfo_filename, rename_map_service.current)
+                        if best_index is not None: return files_with_link[best_index]
             except (ValueError, IndexError):
                 pass
         return max(files_with_link, key=lambda x: x.get("size", 0))
@@ -314,49 +372,54 @@ class StremThru:
         if status in ["cached", "downloaded"]:
             logger.info(f"✅ Torrent pret pour le streaming: {hash} (statut: {status})")
             return magnet, status
-        if status == "downloading":
-            logger.info(f"⏬ Le torrent est en cours de telechargement: {hash}")
-            return None, None
         if status == "failed":
             logger.warning(f"❌ Le telechargement a echoue pour le hash: {hash}")
             return None, None
-        if status == "queued":
-            logger.info(f"📋 Le torrent est en file d'attente: {hash}. Nouvelle verification des fichiers.")
-            try:
-                magnet_link = get_magnet_link(hash) or f"magnet:?xt=urn:btih:{hash}"
-                recheck_response = await self.session.get(f"{self.base_url}/magnets/check?magnet={magnet_link}&client_ip={self.client_ip}&sid={self.sid}", headers=self.default_headers)
-                recheck_data = recheck_response.json()
-                if recheck_data.get("data", {}).get("items") and recheck_data["data"]["items"][0].get("files"):
-                    magnet["data"]["files"] = recheck_data["data"]["items"][0]["files"]
-                    logger.info(f"✅ Les fichiers sont maintenant disponibles pour le torrent en file d'attente: {hash}")
-                    return magnet, status
-                else:
-                    logger.info(f"⏳ Les fichiers ne sont pas encore disponibles pour le torrent en file d'attente: {hash}")
-                    return None, None
-            except Exception as e:
-                logger.warning(f"❌ Erreur lors de la nouvelle verification pour le torrent en file d'attente {hash}: {e}")
-                return None, None
-        if status == "unknown":
-            logger.info(f"🤔 Le statut est inconnu pour {hash}. Forcage de l'analyse avec interrogation.")
-            try:
-                for i in range(10):
-                    magnet_link = get_magnet_link(hash) or f"magnet:?xt=urn:btih:{hash}"
-                    recheck_response = await self.session.get(f"{self.base_url}/magnets/check?magnet={magnet_link}&client_ip={self.client_ip}&sid={self.sid}", headers=self.default_headers)
-                    recheck_data = recheck_response.json()
-                    if recheck_data.get("data", {}).get("items") and recheck_data["data"]["items"][0].get("files"):
-                        magnet["data"]["files"] = recheck_data["data"]["items"][0]["files"]
-                        logger.info(f"✅ Les fichiers sont maintenant disponibles pour le torrent inconnu apres {i+1}s: {hash}")
-                        return magnet, status
-                    await asyncio.sleep(1)
-                logger.warning(f"❌ L'interrogation a expire apres 10s pour {hash}. Aucun fichier trouve.")
-                return None, None
-            except Exception as e:
-                logger.warning(f"❌ Erreur lors de l'interrogation pour le torrent inconnu {hash}: {e}")
-                return None, None
+        if status in ["queued", "unknown"]:
+            # Une seule nouvelle vérification immédiate, le suivi continue ensuite en arrière-plan
+            logger.info(f"📋 Statut {status} pour {hash}. Nouvelle verification des fichiers.")
+            files = await self._recheck_files(hash)
+            if files:
+                magnet["data"]["files"] = files
+                logger.info(f"✅ Les fichiers sont maintenant disponibles pour le torrent {hash} (statut: {status})")
+                return magnet, status
+        if status in ["downloading", "queued", "unknown"]:
+            logger.info(f"⏬ Le torrent n'est pas encore pret: {hash} (statut: {status}), suivi en arriere-plan")
+            await self._track_magnet(hash, magnet)
+            return None, None
         
         logger.warning(f"❓ Statut non gere '{status}' pour le hash {hash}")
         return magnet, status
 
+    async def _recheck_files(self, hash: str):
+        """Interroge /magnets/check une fois et retourne les fichiers du magnet, ou None."""
+        try:
+            magnet_link = get_magnet_link(hash) or f"magnet:?xt=urn:btih:{hash}"
+            recheck_response = await self.session.get(f"{self.base_url}/magnets/check?magnet={magnet_link}&client_ip={self.client_ip}&sid={self.sid}", headers=self.default_headers)
+            recheck_data = recheck_response.json()
+            items = recheck_data.get("data", {}).get("items")
+            return items[0].get("files") if items else None
+        except Exception as e:
+            logger.warning(f"❌ Erreur lors de la nouvelle verification du torrent {hash}: {e}")
+            return None
+
+    async def _track_magnet(self, hash: str, magnet: dict):
+        """
+        Confie le suivi du magnet au gestionnaire de tâches d'arrière-plan.
+        Le suivi interroge le magnet par son identifiant sur le compte : sans identifiant, il n'est pas démarré
+        (ré-ajouter le magnet à chaque vérification n'est pas une option).
+        """
+        magnet_id = (magnet or {}).get("data", {}).get("id")
+        if not magnet_id:
+            logger.warning(f"⚠️ Identifiant du magnet absent de la reponse StremThru pour {hash}, suivi en arriere-plan non demarre")
+            return
+        await magnet_job_manager.schedule(hash, self.real_debrid_name, lambda: self._poll_magnet_status(magnet_id))
+
+    async def _poll_magnet_status(self, magnet_id: str):
+        """Statut actuel du magnet sur le compte (GET /magnets/{id}), pour le suivi en arrière-plan."""
+        magnet_response = await self.session.get(f"{self.base_url}/magnets/{magnet_id}?client_ip={self.client_ip}", headers=self.default_headers)
+        return magnet_response.json().get("data", {}).get("status")
+
     async def _get_magnet_status(self, hash: str):
         """Obtient le statut initial d'un lien magnet auprès de StremThru."""
         magnet_link = get_magnet_link(hash) or f"magnet:?xt=urn:btih:{hash}"
@@ -19,7 +19,14 @@ from fkstream.utils.database import (
     teardown_database,
     cleanup_expired_locks,
 )
+from fkstream.utils.catalog import CatalogStore
+from fkstream.utils.search import CatalogSearch
+from fkstream.debrid.magnet_jobs import magnet_job_manager
+from fkstream.utils.dataset import EMPTY_DATASET, build_dataset_snapshot, load_dataset_snapshot
 from fkstream.utils.http_client import HttpClient
+from fkstream.utils.match_table import EpisodeMatchTable
+from fkstream.utils.prewarm import metadata_prewarmer
+from fkstream.utils.rename_map import rename_map_service
 from fkstream.utils.common_logger import logger
 from fkstream.utils.models import settings
 
@@ -55,24 +62,39 @@ async def lifespan(app: FastAPI):
     Initialise les ressources et charge le dataset local au démarrage.
     """
     update_task = None
+    rename_task = None
+    prewarm_task = None
     await setup_database()
     
     try:
         # Initialisation du client HTTP
         app.state.http_client = HttpClient()
         logger.info("Client HTTP initialisé avec succès")
+        # Ouverture anticipée des connexions aux upstreams, sans retarder le démarrage
+        prewarm_task = asyncio.create_task(app.state.http_client.prewarm())
+
+        # Table de correspondance épisode -> fichier, invalidée par la version du dataset
+        app.state.match_table = EpisodeMatchTable()
+
+        # Catalogue pré-calculé, invalidé par la version du dataset et de fk:list
+        app.state.catalog_store = CatalogStore()
+        app.state.catalog_search = CatalogSearch()
+
+        # Liste de renommage : copie locale immédiate, rafraîchissement réseau en arrière-plan
+        rename_map_service.load_from_disk()
+        rename_task = asyncio.create_task(rename_map_service.run_periodic_refresh(app.state.http_client))
 
         # Chargement du dataset local
         try:
             with open('/data/dataset.json', 'rb') as f:
-                app.state.dataset = orjson.loads(f.read())
-            logger.log("FKSTREAM", "Dataset local chargé avec succès.")
+                app.state.dataset = load_dataset_snapshot(f.read())
+            logger.log("FKSTREAM", f"Dataset local chargé avec succès ({len(app.state.dataset)} animes, version {app.state.dataset.version}).")
         except FileNotFoundError:
             logger.warning("Le fichier 'dataset.json' est introuvable. L'addon ne pourra pas fournir de liens de streaming. Tentative de téléchargement.")
-            app.state.dataset = {"top": []}
+            app.state.dataset = EMPTY_DATASET
         except Exception as e:
             logger.warning(f"Impossible de charger le dataset local: {e}")
-            app.state.dataset = {"top": []}
+            app.state.dataset = EMPTY_DATASET
 
         # Tâche de mise à jour périodique du dataset en arrière-plan
         async def periodic_update_dataset():
@@ -83,13 +105,24 @@ async def lifespan(app: FastAPI):
                     response = await app.state.http_client.get(dataset_url)
                     response.raise_for_status()
                     remote_dataset = orjson.loads(response.content)
-                    # Écriture du dataset distant dans le fichier local
-                    with open('/data/dataset.json', 'wb') as f:
-                        f.write(orjson.dumps(remote_dataset, option=orjson.OPT_INDENT_2))
-                    app.state.dataset = remote_dataset
-                    logger.log("FKSTREAM", "Dataset distant chargé et local mis à jour avec succès.")
+                    snapshot = build_dataset_snapshot(remote_dataset)
+                    if snapshot.version == app.state.dataset.version:
+                        logger.info(f"Dataset distant inchangé (version {snapshot.version}).")
+                    else:
+                        # Écriture du dataset distant dans le fichier local
+                        with open('/data/dataset.json', 'wb') as f:
+                            f.write(orjson.dumps(remote_dataset, option=orjson.OPT_INDENT_2))
+                        app.state.dataset = snapshot
+                        logger.log("FKSTREAM", f"Dataset distant chargé et local mis à jour avec succès (version {snapshot.version}).")
                 except Exception as e:
                     logger.warning(f"Échec de la mise à jour du dataset distant: {e}")
+
+                # Préchauffage des métadonnées des animes du dataset (au démarrage puis après chaque mise à jour)
+                if settings.METADATA_PREWARM:
+                    try:
+                        await metadata_prewarmer.run(app.state.http_client, app.state.dataset)
+                    except Exception as e:
+                        logger.warning(f"Échec du préchauffage des métadonnées: {e}")
                 
                 logger.info("Prochaine mise à jour du dataset dans 1 heure.")
                 await asyncio.sleep(3600)  # 3600 secondes = 1 heure
@@ -109,17 +142,26 @@ async def lifespan(app: FastAPI):
         # Nettoyage à l'arrêt de l'application
         if update_task:
             update_task.cancel()
+        if rename_task:
+            rename_task.cancel()
+        if prewarm_task:
+            prewarm_task.cancel()
         cleanup_task.cancel()
 
         tasks_to_await = [cleanup_task]
         if update_task:
             tasks_to_await.append(update_task)
+        if rename_task:
+            tasks_to_await.append(rename_task)
+        if prewarm_task:
+            tasks_to_await.append(prewarm_task)
 
         try:
             await asyncio.gather(*tasks_to_await, return_exceptions=True)
         except asyncio.CancelledError:
             pass
         
+        await magnet_job_manager.shutdown()
         await app.state.http_client.close()
         await teardown_database()
         logger.info("Ressources de l'application nettoyées.")
@@ -1,27 +1,55 @@
-from typing import List, Optional, Dict, Any
+import asyncio
+from typing import List, Optional, Dict, Any, Tuple
 
 from fkstream.utils.http_client import HttpClient
-from fkstream.utils.database import get_metadata_from_cache, set_metadata_to_cache, DistributedLock, LockAcquisitionError
+from fkstream.utils.database import get_metadata_from_cache, set_metadata_to_cache
+from fkstream.utils.deadline import DeadlineExceeded
 from fkstream.utils.common_logger import logger
+from fkstream.utils.models import settings
+from fkstream.utils.revalidation import metadata_revalidator
 from fkstream.utils.base_client import BaseClient
+from fkstream.utils.singleflight import SingleFlight
 
+# Un seul appel à l'API Fankai par clé de cache manquante, dans ce worker et entre workers
+series_list_flight = SingleFlight("fankai_series_list")
+anime_details_flight = SingleFlight("fankai_anime_details")
 
-async def _fetch_complete_anime_data(fankai_api: "FankaiAPI", anime_id: str) -> dict:
-    """Fonction d'aide pour récupérer les données complètes d'un anime depuis l'API."""
-    anime_data = await fankai_api.get_series_details(anime_id)
+
+async def _fetch_complete_anime_data(fankai_api: "FankaiAPI", anime_id: str) -> Tuple[Optional[dict], bool]:
+    """
+    Récupère les données complètes d'un anime en deux allers-retours : détails, saisons et acteurs
+    en parallèle, puis les épisodes de toutes les saisons en parallèle.
+    Les saisons en échec sont retentées une fois. Retourne (données, complètes) :
+    une partie manquante (saison, liste des saisons ou acteurs) rend le résultat partiel.
+    """
+    anime_data, seasons, actors = await asyncio.gather(
+        fankai_api.get_series_details(anime_id),
+        fankai_api.get_seasons(anime_id),
+        fankai_api.get_actors(anime_id),
+    )
     if not anime_data:
-        return None
+        return None, False
+
+    complete = seasons is not None and actors is not None
+    seasons = seasons or []
+    season_ids = [str(season.get("id")) for season in seasons]
+    episodes = dict(zip(season_ids, await asyncio.gather(*(fankai_api.get_episodes(season_id) for season_id in season_ids))))
+
+    failed_ids = [season_id for season_id, season_episodes in episodes.items() if season_episodes is None]
+    if failed_ids:
+        logger.warning(f"Episodes indisponibles pour l'anime {anime_id}, saisons {failed_ids} : nouvelle tentative")
+        episodes.update(zip(failed_ids, await asyncio.gather(*(fankai_api.get_episodes(season_id) for season_id in failed_ids))))
+        failed_ids = [season_id for season_id in failed_ids if episodes[season_id] is None]
+        if failed_ids:
+            logger.error(f"Episodes toujours indisponibles pour l'anime {anime_id}, saisons {failed_ids}")
+            complete = False
+
+    for season, season_id in zip(seasons, season_ids):
+        season["episodes"] = episodes[season_id] or []
 
-    seasons = await fankai_api.get_seasons(anime_id)
-    for season in seasons:
-        season_episodes = await fankai_api.get_episodes(str(season.get("id")))
-        season["episodes"] = season_episodes
-    
-    actors = await fankai_api.get_actors(anime_id)
-    
     anime_data["seasons"] = seasons
-    anime_data["actors"] = actors
-    return anime_data
+    anime_data["actors"] = actors or []
+    return anime_data, complete
 
 
 class FankaiAPI(BaseClient):
@@ -32,13 +60,17 @@ class FankaiAPI(BaseClient):
         self.base_url = "https://metadata.fankai.fr"
         self.client = client
 
+    async def _get_json(self, path: str):
+        """GET sur l'API Fankai. La limite de requêtes simultanées est appliquée par HttpClient (profil fankai)."""
+        response = await self.client.get(f"{self.base_url}{path}")
+        response.raise_for_status()
+        return response.json()
+
     async def get_all_series(self) -> List[Dict[str, Any]]:
         """Récupère la liste complète de toutes les séries."""
         try:
             logger.info("Recuperation de toutes les series depuis l'API Fankai Metadata...")
-            response = await self.client.get(f"{self.base_url}/series?paginate=false")
-            response.raise_for_status()
-            return response.json()
+            return await self._get_json("/series?paginate=false")
         except Exception as e:
             logger.error(f"Echec de la recuperation de toutes les series: {e}")
             return []
@@ -47,52 +79,75 @@ class FankaiAPI(BaseClient):
         """Récupère les détails d'une série par son ID."""
         try:
             logger.info(f"Recuperation des details pour la serie ID: {series_id}")
-            response = await self.client.get(f"{self.base_url}/series/{series_id}")
-            response.raise_for_status()
-            return response.json()
+            return await self._get_json(f"/series/{series_id}")
         except Exception as e:
             logger.error(f"Echec de la recuperation des details pour la serie ID {series_id}: {e}")
             return None
 
-    async def get_seasons(self, series_id: str) -> List[Dict[str, Any]]:
-        """Récupère les saisons d'une série."""
+    async def get_seasons(self, series_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Récupère les saisons d'une série. Retourne None en cas d'échec."""
         try:
             logger.info(f"Recuperation des saisons pour la serie ID: {series_id}")
-            response = await self.client.get(f"{self.base_url}/series/{series_id}/seasons")
-            response.raise_for_status()
-            return response.json().get("seasons", [])
+            return (await self._get_json(f"/series/{series_id}/seasons")).get("seasons", [])
         except Exception as e:
             logger.error(f"Echec de la recuperation des saisons pour l'ID {series_id}: {e}")
-            return []
+            return None
 
-    async def get_episodes(self, season_id: str) -> List[Dict[str, Any]]:
-        """Récupère les épisodes d'une saison."""
+    async def get_episodes(self, season_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Récupère les épisodes d'une saison. Retourne None en cas d'échec."""
         try:
             logger.info(f"Recuperation des episodes pour la saison ID: {season_id}")
-            response = await self.client.get(f"{self.base_url}/seasons/{season_id}/episodes")
-            response.raise_for_status()
-            return response.json().get("episodes", [])
+            return (await self._get_json(f"/seasons/{season_id}/episodes")).get("episodes", [])
         except Exception as e:
             logger.error(f"Echec de la recuperation des episodes pour l'ID {season_id}: {e}")
-            return []
+            return None
 
-    async def get_actors(self, series_id: str) -> List[Dict[str, Any]]:
-        """Récupère les acteurs d'une série."""
+    async def get_actors(self, series_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Récupère les acteurs d'une série. Retourne None en cas d'échec."""
         try:
             logger.info(f"Recuperation des acteurs pour la serie ID: {series_id}")
-            response = await self.client.get(f"{self.base_url}/series/{series_id}/actors")
-            response.raise_for_status()
-            return response.json().get("actors", [])
+            return (await self._get_json(f"/series/{series_id}/actors")).get("actors", [])
         except Exception as e:
             logger.error(f"Echec de la recuperation des acteurs pour l'ID {series_id}: {e}")
-            return []
+            return None
+
+
+async def get_or_fetch_series_list(fankai_api: "FankaiAPI") -> List[Dict[str, Any]]:
+    """
+    Obtient la liste de toutes les séries (fk:list) depuis le cache, sinon depuis l'API Fankai.
+    Une liste expirée est servie pendant son rafraîchissement en arrière-plan.
+    Une liste vide (échec de l'API) n'est pas mise en cache.
+    """
+    animes_data = await get_metadata_from_cache("fk:list")
+    if animes_data:
+        logger.debug("✅ CACHE HIT: fk:list")
+        return animes_data
+
+    async def load():
+        logger.debug("📦 CACHE MISS: fk:list - Recuperation depuis l'API")
+        return await series_list_flight.do("fk:list", lambda: _fetch_and_cache_series_list(fankai_api), distributed=True, recheck=lambda: get_metadata_from_cache("fk:list"))
+
+    return await metadata_revalidator.serve("fk:list", load)
+
+
+async def refresh_series_list(fankai_api: "FankaiAPI") -> List[Dict[str, Any]]:
+    """Recharge fk:list depuis l'API même si elle est en cache. En cas d'échec, l'entrée en cache est conservée."""
+    return await series_list_flight.do("fk:list", lambda: _fetch_and_cache_series_list(fankai_api))
+
+
+async def _fetch_and_cache_series_list(fankai_api: "FankaiAPI") -> List[Dict[str, Any]]:
+    animes_data = await fankai_api.get_all_series()
+    if animes_data:
+        await set_metadata_to_cache("fk:list", animes_data)
+        logger.debug("✅ CACHE SAUVEGARDE: fk:list")
+    return animes_data
 
 
 async def get_or_fetch_anime_details(fankai_api: "FankaiAPI", anime_id: str) -> Optional[Dict[str, Any]]:
     """
     Obtient les détails d'un anime depuis le cache si disponible, sinon les récupère
-    depuis l'API Fankai, gère le verrouillage pour éviter les conditions de concurrence,
-    et met le résultat en cache.
+    depuis l'API Fankai (un seul appel pour les demandes simultanées, tous workers confondus)
+    et met le résultat en cache. Des détails expirés sont servis pendant leur rafraîchissement en arrière-plan.
     """
     media_id = f"fk:{anime_id}"
     cached_anime = await get_metadata_from_cache(media_id)
@@ -101,26 +156,29 @@ async def get_or_fetch_anime_details(fankai_api: "FankaiAPI", anime_id: str) ->
         logger.info(f"✅ CACHE HIT: {media_id}")
         return cached_anime
 
-    lock_key = f"metadata_fetch_{anime_id}"
+    async def load():
+        logger.info(f"📦 CACHE MISS: {media_id} - Recuperation depuis l'API")
+        return await anime_details_flight.do(media_id, lambda: _fetch_and_cache_anime_details(fankai_api, anime_id), distributed=True, recheck=lambda: get_metadata_from_cache(media_id))
+
     try:
-        async with DistributedLock(lock_key):
-            cached_anime = await get_metadata_from_cache(media_id)
-            if cached_anime:
-                logger.info(f"✅ CACHE HIT apres verrou: {media_id}")
-                return cached_anime
-
-            logger.info(f"📦 CACHE MISS: {media_id} - Recuperation depuis l'API avec verrou")
-            anime_data = await _fetch_complete_anime_data(fankai_api, anime_id)
-            if anime_data:
-                await set_metadata_to_cache(media_id, anime_data)
-            return anime_data
-            
-    except LockAcquisitionError:
-        logger.warning(f"Impossible d'acquerir le verrou de metadonnees pour {anime_id}, nouvelle tentative sans verrou.")
-        anime_data = await _fetch_complete_anime_data(fankai_api, anime_id)
-        if anime_data:
-            await set_metadata_to_cache(media_id, anime_data)
-        return anime_data
+        return await metadata_revalidator.serve(media_id, load)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Une erreur inattendue s'est produite lors de la recuperation des details de l'anime pour {anime_id}: {e}")
         return None
+
+
+async def refresh_anime_details(fankai_api: "FankaiAPI", anime_id: str) -> Optional[Dict[str, Any]]:
+    """Recharge les détails d'un anime depuis l'API même s'ils sont en cache. En cas d'échec, l'entrée en cache est conservée."""
+    return await anime_details_flight.do(f"fk:{anime_id}", lambda: _fetch_and_cache_anime_details(fankai_api, anime_id))
+
+
+async def _fetch_and_cache_anime_details(fankai_api: "FankaiAPI", anime_id: str) -> Optional[Dict[str, Any]]:
+    media_id = f"fk:{anime_id}"
+    anime_data, complete = await _fetch_complete_anime_data(fankai_api, anime_id)
+    if anime_data:
+        if not complete:
+            logger.warning(f"⚠️ Metadonnees partielles pour {media_id}, mises en cache pour {settings.METADATA_PARTIAL_TTL}s")
+        await set_metadata_to_cache(media_id, anime_data, None if complete else settings.METADATA_PARTIAL_TTL)
+    return anime_data
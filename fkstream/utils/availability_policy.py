@@ -0,0 +1,50 @@
+import random
+
+from fkstream.utils.models import settings
+
+# Statuts StremThru -> statut stocké dans le cache de disponibilité
+_STATUS_MAPPING = {
+    "cached": "cached",
+    "downloaded": "cached",
+    "downloading": "downloading",
+    "queued": "downloading",
+    "processing": "downloading",
+    "uploading": "downloading",
+    "failed": "downloading",
+}
+
+
+class AvailabilityCachePolicy:
+    """
+    Politique de durée de vie du cache de disponibilité selon le statut :
+    longue pour "cached", courte pour un torrent en cours de téléchargement,
+    courte aussi (cache négatif) pour "unknown" et "not_cached".
+    Une gigue aléatoire évite que toutes les entrées écrites ensemble expirent en même temps.
+    """
+
+    def __init__(self, cached_ttl: int, downloading_ttl: int, negative_ttl: int, jitter: float):
+        self.ttls = {
+            "cached": cached_ttl,
+            "downloading": downloading_ttl,
+            "unknown": negative_ttl,
+        }
+        self.jitter = max(0.0, min(jitter, 1.0))
+
+    def normalize(self, api_status: str) -> str:
+        """Ramène un statut StremThru à l'un des statuts du cache : cached, downloading ou unknown."""
+        return _STATUS_MAPPING.get(api_status, "unknown")
+
+    def ttl(self, status: str) -> float:
+        """Durée de vie (secondes) d'une entrée, gigue comprise."""
+        base_ttl = self.ttls.get(status, self.ttls["unknown"])
+        if not self.jitter:
+            return base_ttl
+        return base_ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+availability_policy = AvailabilityCachePolicy(
+    cached_ttl=settings.DEBRID_AVAILABILITY_TTL,
+    downloading_ttl=settings.DEBRID_DOWNLOADING_TTL,
+    negative_ttl=settings.DEBRID_NEGATIVE_TTL,
+    jitter=settings.DEBRID_TTL_JITTER,
+)
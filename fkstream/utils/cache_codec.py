@@ -0,0 +1,66 @@
+import json
+import zlib
+from typing import Any, Optional, Union
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # dépendance optionnelle : pip install fkstream[zstd]
+    zstandard = None
+
+# Octet d'en-tête indiquant le format de la valeur stockée
+CODEC_ORJSON = 0x01
+CODEC_ORJSON_ZLIB = 0x02
+CODEC_ORJSON_ZSTD = 0x03
+
+# En dessous de ce seuil (octets), la valeur est stockée sans compression
+COMPRESSION_THRESHOLD = 1024
+
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+
+_zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def encode_cache_value(data: Any, compression: Optional[str] = None) -> bytes:
+    """
+    Sérialise une valeur du cache : un octet d'en-tête puis le JSON orjson, compressé
+    (zstd si disponible, sinon zlib) au-delà de COMPRESSION_THRESHOLD.
+    """
+    payload = orjson.dumps(data)
+    if len(payload) < COMPRESSION_THRESHOLD:
+        return bytes((CODEC_ORJSON,)) + payload
+
+    compression = compression or ("zstd" if _zstd_compressor else "zlib")
+    if compression == "zstd" and _zstd_compressor:
+        return bytes((CODEC_ORJSON_ZSTD,)) + _zstd_compressor.compress(payload)
+    return bytes((CODEC_ORJSON_ZLIB,)) + zlib.compress(payload, ZLIB_LEVEL)
+
+
+def decode_cache_value(value: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    Désérialise une valeur du cache. Accepte aussi les anciennes lignes (texte JSON sans en-tête).
+    Lève ValueError si la valeur est illisible.
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    value = bytes(value)
+    if not value:
+        raise ValueError("Valeur de cache vide")
+
+    codec, payload = value[0], value[1:]
+    if codec == CODEC_ORJSON:
+        return orjson.loads(payload)
+    if codec == CODEC_ORJSON_ZLIB:
+        try:
+            return orjson.loads(zlib.decompress(payload))
+        except zlib.error as e:
+            raise ValueError(f"Valeur zlib corrompue: {e}") from e
+    if codec == CODEC_ORJSON_ZSTD:
+        if not _zstd_decompressor:
+            raise ValueError("Valeur compressee en zstd mais le module zstandard n'est pas installe")
+        return orjson.loads(_zstd_decompressor.decompress(payload))
+    # Ancien format : JSON brut sans en-tête
+    return orjson.loads(value)
@@ -0,0 +1,240 @@
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlparse
+
+import orjson
+
+from fkstream.utils.common_logger import logger
+
+# Ordres de tri supportés par le catalogue
+SORT_KEYS = ("last_update", "rating_value", "title", "year")
+
+# Taille de page attendue par Stremio pour l'extra "skip"
+CATALOG_PAGE_SIZE = 100
+
+# Formes de meta disponibles pour les lignes du catalogue
+CATALOG_DISPLAYS = ("full", "compact")
+
+# Marqueur remplacé à la volée par l'URL encodée du manifeste de l'utilisateur
+MANIFEST_PLACEHOLDER = "__FKSTREAM_MANIFEST__"
+_MANIFEST_PLACEHOLDER_BYTES = MANIFEST_PLACEHOLDER.encode()
+
+_STATUS_TRANSLATIONS = {
+    "Continuing": "En cours",
+    "Ended": "Terminé",
+    "Unknown": None,
+    "Canceled": "Annulé",
+    "Cancelled": "Annulé",
+    "En suspens": "En suspens"
+}
+
+
+def translate_status(status: str) -> str:
+    """Traduit le statut de l'anime en français."""
+    return _STATUS_TRANSLATIONS.get(status, status)
+
+
+def split_genres(genres_raw: str) -> List[str]:
+    """Découpe la chaîne de genres séparés par des virgules."""
+    return [g.strip() for g in genres_raw.split(',') if g.strip()] if genres_raw else []
+
+
+def fold_text(text: str) -> str:
+    """Minuscules sans accents (NFKD) : "Henshū" -> "henshu"."""
+    if not text:
+        return ''
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).casefold()
+
+
+def youtube_trailer_id(trailer_url: str) -> Optional[str]:
+    """Extrait l'identifiant YouTube d'une URL de bande-annonce, ou None."""
+    if not trailer_url or "youtube" not in trailer_url:
+        return None
+    try:
+        query_params = parse_qs(urlparse(trailer_url).query)
+        return query_params.get("video_id", query_params.get("v", [None]))[0]
+    except Exception as e:
+        logger.warning(f"TRAILER - Impossible de parser l'URL de la bande-annonce '{trailer_url}': {e}")
+        return None
+
+
+def _sort_value(anime: dict, key: str):
+    """Valeur de tri d'un anime, avec les mêmes replis que l'ancien tri par requête."""
+    val = anime.get(key)
+    if val is None:
+        if key in ['rating_value', 'year']: return -1
+        if key == 'last_update': return datetime.min
+        return ""
+    if key in ['rating_value', 'year']:
+        try: return float(val)
+        except (ValueError, TypeError): return -1
+    if key == 'last_update':
+        try: return datetime.fromisoformat(str(val).replace(" ", "T"))
+        except (ValueError, TypeError): return datetime.min
+    return val
+
+
+def build_catalog_meta(anime: dict, genres: List[str]) -> dict:
+    """Construit le meta Stremio d'une ligne du catalogue, avec le marqueur de manifeste dans les liens."""
+    genre_links = [
+        {
+            "name": genre_name,
+            "category": "Genres",
+            "url": f"stremio:///discover/{MANIFEST_PLACEHOLDER}/anime/fankai_catalog?genre={quote(genre_name)}"
+        }
+        for genre_name in genres
+    ]
+    imdb_links = []
+    if anime.get('imdb_id'):
+        rating_display = str(anime.get('rating_value')) if anime.get('rating_value') else "N/A"
+        imdb_links.append({
+            "name": rating_display,
+            "category": "imdb",
+            "url": f"https://imdb.com/title/{anime.get('imdb_id')}"
+        })
+
+    meta = {
+        "id": f"fk:{anime.get('id')}",
+        "type": "anime",
+        "logo": anime.get('logo_image'),
+        "name": anime.get('title', ''),
+        "poster": anime.get('poster_image'),
+        "posterShape": "poster",
+        "genres": genres,
+        "imdbRating": str(anime.get('rating_value')) if anime.get('rating_value') else None,
+        "releaseInfo": str(anime.get('year')) if anime.get('year') else None,
+        "runtime": translate_status(anime.get('status')) if anime.get('status') else None,
+        "imdb_id": anime.get('imdb_id'),
+        "description": anime.get('plot', '') or "Aucune description disponible",
+        "links": genre_links + imdb_links,
+    }
+
+    video_id = youtube_trailer_id(anime.get("trailer_url"))
+    if video_id:
+        meta['trailers'] = [{"source": video_id, "type": "Trailer"}]
+    return meta
+
+
+def build_compact_catalog_meta(anime: dict, genres: List[str]) -> dict:
+    """Forme allégée d'une ligne du catalogue : affiche, nom, id et genres, sans description ni liens."""
+    return {
+        "id": f"fk:{anime.get('id')}",
+        "type": "anime",
+        "name": anime.get('title', ''),
+        "poster": anime.get('poster_image'),
+        "posterShape": "poster",
+        "genres": genres,
+    }
+
+
+def _join_metas(rows) -> bytes:
+    """Assemble des metas déjà sérialisés en un corps de réponse {"metas": [...]}."""
+    return b'{"metas":[' + b','.join(rows) + b']}'
+
+
+class MaterializedCatalog:
+    """
+    Catalogue pré-calculé pour une (version du dataset, version de fk:list) :
+    index inversé genre -> ids pré-triés par ordre de tri, liste des genres du manifeste,
+    clés de recherche sans accents, lignes pré-sérialisées pour chaque forme de meta
+    et première page déjà assemblée. Aucune requête ne redécoupe de chaîne de genres.
+    """
+
+    def __init__(self, version: tuple, animes: List[dict]):
+        self.version = version
+        self.search_keys: Dict[str, str] = {}
+        self.genres: Dict[str, Tuple[str, ...]] = {}
+        self.rows: Dict[str, Dict[str, bytes]] = {display: {} for display in CATALOG_DISPLAYS}
+
+        for anime in animes:
+            anime_id = str(anime.get('id'))
+            genres = split_genres(anime.get('genres', ''))
+            self.search_keys[anime_id] = fold_text(anime.get('title', '') or '')
+            self.genres[anime_id] = tuple(genres)
+            self.rows["full"][anime_id] = orjson.dumps(build_catalog_meta(anime, genres))
+            self.rows["compact"][anime_id] = orjson.dumps(build_compact_catalog_meta(anime, genres))
+
+        self.orders: Dict[str, Tuple[str, ...]] = {}
+        for sort_by in SORT_KEYS:
+            ordered = sorted(animes, key=lambda x: _sort_value(x, sort_by), reverse=sort_by != 'title')
+            self.orders[sort_by] = tuple(str(anime.get('id')) for anime in ordered)
+
+        # Liste triée des genres, servie telle quelle dans le manifeste
+        self.genre_names: Tuple[str, ...] = tuple(sorted({genre for genres in self.genres.values() for genre in genres}))
+
+        # Postings genre -> ids, dans chaque ordre de tri
+        self.listings: Dict[Tuple[str, Optional[str]], Tuple[str, ...]] = {}
+        for sort_by, order in self.orders.items():
+            postings: Dict[str, List[str]] = {genre: [] for genre in self.genre_names}
+            for anime_id in order:
+                for genre in self.genres[anime_id]:
+                    postings[genre].append(anime_id)
+            self.listings[(sort_by, None)] = order
+            for genre, anime_ids in postings.items():
+                self.listings[(sort_by, genre)] = tuple(anime_ids)
+
+        self.first_pages: Dict[Tuple[str, str, Optional[str]], bytes] = {
+            (display, sort_by, genre): self._page(display, listing, 0)
+            for display in CATALOG_DISPLAYS
+            for (sort_by, genre), listing in self.listings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.search_keys)
+
+    def _page(self, display: str, listing: Tuple[str, ...], skip: int) -> bytes:
+        rows = self.rows[display]
+        return _join_metas(rows[anime_id] for anime_id in listing[skip:skip + CATALOG_PAGE_SIZE])
+
+    def _listing(self, sort_by: str, genre: Optional[str]) -> Tuple[str, Tuple[str, ...]]:
+        if sort_by not in self.orders:
+            sort_by = "last_update"
+        return sort_by, self.listings.get((sort_by, genre or None), ())
+
+    def select(self, sort_by: str, genre: Optional[str] = None, skip: int = 0, display: str = "full") -> Tuple[bytes, int]:
+        """
+        Retourne le corps JSON d'une page (avec marqueur de manifeste) et le nombre de metas de la page :
+        une lecture de la première page pré-assemblée ou une découpe de liste pré-triée.
+        """
+        sort_by, listing = self._listing(sort_by, genre)
+        display = display if display in self.rows else "full"
+        skip = max(skip or 0, 0)
+        if skip == 0 and listing:
+            body = self.first_pages[(display, sort_by, genre or None)]
+        else:
+            body = self._page(display, listing, skip)
+        return body, len(listing[skip:skip + CATALOG_PAGE_SIZE])
+
+    def select_ranked(self, scores: Dict[str, float], sort_by: str, genre: Optional[str] = None, skip: int = 0, display: str = "full") -> Tuple[bytes, int]:
+        """
+        Comme select, pour des résultats de recherche {anime_id: score} :
+        tri par pertinence, puis par l'ordre de tri demandé à pertinence égale.
+        """
+        _, listing = self._listing(sort_by, genre)
+        display = display if display in self.rows else "full"
+        skip = max(skip or 0, 0)
+        ranked = tuple(sorted((anime_id for anime_id in listing if anime_id in scores), key=lambda anime_id: -scores[anime_id]))
+        return self._page(display, ranked, skip), len(ranked[skip:skip + CATALOG_PAGE_SIZE])
+
+
+def render_catalog_body(body: bytes, manifest_url: str) -> bytes:
+    """Remplace le marqueur par l'URL du manifeste encodée pour l'utilisateur courant."""
+    return body.replace(_MANIFEST_PLACEHOLDER_BYTES, quote(manifest_url, safe='').encode())
+
+
+class CatalogStore:
+    """Conserve le dernier catalogue matérialisé et le reconstruit quand sa version change."""
+
+    def __init__(self):
+        self._catalog: Optional[MaterializedCatalog] = None
+
+    def get(self, version: tuple) -> Optional[MaterializedCatalog]:
+        catalog = self._catalog
+        return catalog if catalog is not None and catalog.version == version else None
+
+    def build(self, version: tuple, animes: List[dict]) -> MaterializedCatalog:
+        catalog = MaterializedCatalog(version, animes)
+        self._catalog = catalog
+        logger.info(f"📚 CATALOG - Catalogue materialise ({len(catalog)} animes, {len(catalog.listings)} listes, version {version})")
+        return catalog
@@ -0,0 +1,84 @@
+import time
+from typing import Optional
+
+import httpx
+
+from fkstream.utils.common_logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Requête refusée sans appel réseau : le disjoncteur de l'upstream est ouvert."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un upstream, partagé par toutes les requêtes du worker.
+    Après `failure_threshold` échecs consécutifs (erreurs réseau, 5xx), les requêtes sont refusées
+    immédiatement pendant `reset_timeout` secondes. Une seule requête de sonde passe ensuite (semi-ouvert) :
+    son succès referme le disjoncteur, son échec le rouvre pour un nouveau délai.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """True si `allow()` refuserait une requête : même règle, sans changer d'état."""
+        now = time.time()
+        if self.state == OPEN:
+            return now - self.opened_at < self.reset_timeout
+        if self.state == HALF_OPEN:
+            return self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout
+        return False
+
+    def allow(self) -> bool:
+        """Indique si une requête peut partir. En semi-ouvert, seule la sonde est autorisée."""
+        now = time.time()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probe_started_at = None
+            logger.info(f"🔌 Disjoncteur {self.name} semi-ouvert, envoi d'une requete de sonde")
+        # Une sonde restée sans réponse (requête annulée) ne bloque pas l'upstream indéfiniment
+        if self.state == HALF_OPEN and (self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout):
+            self._probe_started_at = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"✅ Disjoncteur {self.name} referme, l'upstream repond de nouveau")
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = time.time()
+            self._probe_started_at = None
+            self.times_opened += 1
+            logger.warning(f"⛔ Disjoncteur {self.name} ouvert apres {self.failures} echecs, requetes refusees pendant {self.reset_timeout:.0f}s")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -1,9 +1,17 @@
 import os
+import random
+import socket
 import time
-import json
 import asyncio
+import uuid
+from collections import OrderedDict
+from typing import Optional
 
+from fkstream.utils.availability_policy import availability_policy
+from fkstream.utils.cache_codec import decode_cache_value, encode_cache_value
 from fkstream.utils.common_logger import logger
+from fkstream.utils.deadline import bounded_timeout, check_deadline
+from fkstream.utils.lock_notifier import LOCK_RELEASE_CHANNEL, lock_notifier
 from fkstream.utils.models import database, settings
 
 DATABASE_VERSION = "1.1"
@@ -28,7 +36,7 @@ async def setup_database():
             logger.log("FKSTREAM", f"Base de donnees: Migration de la version {current_version} a {DATABASE_VERSION}")
 
             if settings.DATABASE_TYPE == "sqlite":
-                allowed_tables = {'scrape_lock', 'metadata', 'debrid_availability'}
+                allowed_tables = {'scrape_lock', 'metadata', 'debrid_availability', 'debrid_availability_legacy', 'account_status', 'magnet_jobs'}
                 tables = await database.fetch_all("SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN ('db_version', 'sqlite_sequence')")
                 for table in tables:
                     table_name = table['name']
@@ -57,8 +65,22 @@ async def setup_database():
             logger.log("FKSTREAM", f"Base de donnees: Migration vers la version {DATABASE_VERSION} terminee")
 
         await database.execute("CREATE TABLE IF NOT EXISTS scrape_lock (lock_key TEXT PRIMARY KEY, instance_id TEXT, timestamp INTEGER, expires_at INTEGER)")
-        await database.execute("CREATE TABLE IF NOT EXISTS metadata (media_id TEXT PRIMARY KEY, media_data TEXT, timestamp REAL NOT NULL, expires_at REAL)")
-        await database.execute("CREATE TABLE IF NOT EXISTS debrid_availability (media_id TEXT NOT NULL, hash TEXT NOT NULL, debrid_service TEXT NOT NULL, status TEXT NOT NULL, timestamp REAL NOT NULL, expires_at REAL, PRIMARY KEY (media_id, hash, debrid_service))")
+        await database.execute(f"CREATE TABLE IF NOT EXISTS metadata (media_id TEXT PRIMARY KEY, media_data TEXT, timestamp REAL NOT NULL, expires_at REAL, media_blob {'BLOB' if settings.DATABASE_TYPE == 'sqlite' else 'BYTEA'})")
+        # Les anciennes bases n'ont que la colonne texte media_data : ajout de la colonne binaire du codec
+        # Version par entrée, incrémentée à chaque écriture : les caches L1 des workers n'invalident que les entrées modifiées
+        if settings.DATABASE_TYPE == "sqlite":
+            metadata_columns = {row["name"] for row in await database.fetch_all("PRAGMA table_info(metadata)")}
+            if "media_blob" not in metadata_columns:
+                await database.execute("ALTER TABLE metadata ADD COLUMN media_blob BLOB")
+            if "version" not in metadata_columns:
+                await database.execute("ALTER TABLE metadata ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        else:
+            await database.execute("ALTER TABLE metadata ADD COLUMN IF NOT EXISTS media_blob BYTEA")
+            await database.execute("ALTER TABLE metadata ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0")
+        await database.execute("CREATE INDEX IF NOT EXISTS metadata_timestamp_idx ON metadata (timestamp)")
+        await _migrate_debrid_availability_to_hash_key()
+        await database.execute("CREATE TABLE IF NOT EXISTS account_status (token_hash TEXT PRIMARY KEY, is_premium BOOLEAN NOT NULL, timestamp REAL NOT NULL, expires_at REAL)")
+        await database.execute("CREATE TABLE IF NOT EXISTS magnet_jobs (hash TEXT NOT NULL, debrid_service TEXT NOT NULL, owner TEXT NOT NULL, status TEXT NOT NULL, magnet_status TEXT, attempts INTEGER NOT NULL, next_check REAL, timestamp REAL NOT NULL, lease_expires_at REAL NOT NULL, PRIMARY KEY (hash, debrid_service))")
 
         if settings.DATABASE_TYPE == "sqlite":
             await database.execute("PRAGMA busy_timeout=30000")
@@ -70,15 +92,58 @@ async def setup_database():
 
         current_time = time.time()
         cleanup_tasks = [
-            database.execute("DELETE FROM metadata WHERE expires_at IS NOT NULL AND expires_at < :current_time;", {"current_time": current_time}),
+            database.execute("DELETE FROM metadata WHERE expires_at IS NOT NULL AND expires_at < :oldest;", {"oldest": current_time - settings.METADATA_STALE_GRACE}),
             database.execute("DELETE FROM debrid_availability WHERE expires_at IS NOT NULL AND expires_at < :current_time;", {"current_time": current_time}),
+            database.execute("DELETE FROM account_status WHERE expires_at IS NOT NULL AND expires_at < :current_time;", {"current_time": current_time}),
+            database.execute("DELETE FROM magnet_jobs WHERE lease_expires_at < :current_time;", {"current_time": current_time}),
         ]
         await asyncio.gather(*cleanup_tasks, return_exceptions=True)
 
+        await lock_notifier.start()
+
     except Exception as e:
         logger.error(f"Erreur lors de la configuration de la base de donnees: {e}")
 
 
+async def _table_columns(table_name: str) -> set:
+    """Colonnes d'une table (ensemble vide si la table n'existe pas)."""
+    if settings.DATABASE_TYPE == "sqlite":
+        rows = await database.fetch_all(f"PRAGMA table_info({table_name})")
+        return {row["name"] for row in rows}
+    rows = await database.fetch_all(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = :table_name",
+        {"table_name": table_name},
+    )
+    return {row["column_name"] for row in rows}
+
+
+async def _migrate_debrid_availability_to_hash_key():
+    """
+    Crée la table debrid_availability indexée par (hash, debrid_service).
+    L'ancienne table, indexée aussi par media_id (un épisode), est renommée, ses lignes sont regroupées
+    par (hash, debrid_service) en gardant le statut le plus récent, puis elle est supprimée.
+    """
+    if "media_id" in await _table_columns("debrid_availability"):
+        logger.log("FKSTREAM", "Base de donnees: Migration de debrid_availability vers une cle (hash, debrid_service)")
+        await database.execute("ALTER TABLE debrid_availability RENAME TO debrid_availability_legacy")
+
+    await database.execute("CREATE TABLE IF NOT EXISTS debrid_availability (hash TEXT NOT NULL, debrid_service TEXT NOT NULL, status TEXT NOT NULL, timestamp REAL NOT NULL, expires_at REAL, PRIMARY KEY (hash, debrid_service))")
+
+    if await _table_columns("debrid_availability_legacy"):
+        async with database.transaction():
+            await database.execute("""
+                INSERT INTO debrid_availability (hash, debrid_service, status, timestamp, expires_at)
+                SELECT hash, debrid_service, status, timestamp, expires_at FROM (
+                    SELECT hash, debrid_service, status, timestamp, expires_at,
+                           ROW_NUMBER() OVER (PARTITION BY hash, debrid_service ORDER BY timestamp DESC) AS row_rank
+                    FROM debrid_availability_legacy
+                ) ranked
+                WHERE row_rank = 1
+            """)
+            await database.execute("DROP TABLE debrid_availability_legacy")
+        logger.log("FKSTREAM", "Base de donnees: Migration de debrid_availability terminee")
+
+
 async def cleanup_expired_locks():
     """Tâche de nettoyage périodique pour les verrous expirés."""
     while True:
@@ -90,52 +155,340 @@ async def cleanup_expired_locks():
         await asyncio.sleep(60)
 
 
+class MetadataL1Cache:
+    """
+    Cache LRU en mémoire, propre à chaque worker, des métadonnées déjà décodées, placé devant la table metadata.
+    Chaque entrée garde la version de sa ligne. Au plus une fois par `check_interval`, le worker relit les
+    (media_id, version) écrits depuis sa dernière vérification et n'écarte que les entrées dont la version a changé.
+    Les objets retournés sont partagés entre les requêtes et ne doivent pas être modifiés.
+    """
+
+    def __init__(self, max_size: int, ttl: int, check_interval: float = 1.0, clock_skew: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        # Recouvrement des fenêtres de vérification, pour les écritures d'hôtes à l'horloge légèrement décalée
+        self.clock_skew = clock_skew
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # media_id -> (données, timestamp, expires_at, version)
+        self._synced_at: Optional[float] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    async def _sync_versions(self) -> None:
+        """Écarte, au plus une fois par intervalle, les entrées réécrites par un autre worker."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        sync_time = time.time()
+        if self._synced_at is None or not self._entries:
+            self._synced_at = sync_time
+            return
+        try:
+            rows = await database.fetch_all(
+                "SELECT media_id, version FROM metadata WHERE timestamp > :since",
+                {"since": self._synced_at - self.clock_skew},
+            )
+        except Exception as e:
+            # Sans vérification possible, rien n'est servi depuis la mémoire
+            logger.debug(f"Lecture des versions de metadonnees impossible: {e}")
+            self._entries.clear()
+            self._synced_at = None
+            return
+        for row in rows:
+            entry = self._entries.get(row["media_id"])
+            if entry is not None and entry[3] != row["version"]:
+                del self._entries[row["media_id"]]
+                self.invalidations += 1
+        self._synced_at = sync_time
+
+    async def get(self, media_id: str) -> Optional[tuple]:
+        """Retourne (données, timestamp) si l'entrée est en cache et valide, sinon None."""
+        if not self.enabled:
+            return None
+        await self._sync_versions()
+        entry = self._entries.get(media_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[2] <= time.time():
+            del self._entries[media_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(media_id)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, media_id: str, data, timestamp: float, expires_at: Optional[float], version: int) -> None:
+        if not self.enabled or self._synced_at is None:
+            return
+        local_expiry = time.time() + self.ttl
+        self._entries[media_id] = (data, timestamp, min(expires_at, local_expiry) if expires_at else local_expiry, version)
+        self._entries.move_to_end(media_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+metadata_l1_cache = MetadataL1Cache(settings.METADATA_L1_CACHE_SIZE, settings.METADATA_L1_CACHE_TTL)
+
+
+def _decode_metadata_row(row):
+    """Décode une ligne de metadata : colonne binaire du codec, ou ancienne colonne texte. None si illisible."""
+    value = row["media_blob"] if row["media_blob"] is not None else row["media_data"]
+    if not value:
+        return None
+    try:
+        return decode_cache_value(value)
+    except ValueError as e:
+        logger.warning(f"Entree de cache illisible pour {row['media_id']}: {e}")
+        return None
+
+
 async def get_metadata_from_cache(media_id: str):
-    """Récupère les métadonnées depuis le cache."""
+    """Récupère les métadonnées depuis le cache L1 du worker, sinon depuis la base."""
+    cached = await metadata_l1_cache.get(media_id)
+    if cached is not None:
+        return cached[0]
+
+    check_deadline(f"la lecture de {media_id} en cache")
     current_time = time.time()
-    query = "SELECT media_data FROM metadata WHERE media_id = :media_id AND expires_at > :current_time"
+    query = "SELECT media_id, media_data, media_blob, timestamp, expires_at, version FROM metadata WHERE media_id = :media_id AND expires_at > :current_time"
     result = await database.fetch_one(query, {"media_id": media_id, "current_time": current_time})
-    if not result or not result["media_data"]:
+    if not result:
         return None
-    try:
-        return json.loads(result["media_data"])
-    except json.JSONDecodeError:
+    data = _decode_metadata_row(result)
+    if data is None:
         return None
+    metadata_l1_cache.put(media_id, data, result["timestamp"], result["expires_at"], result["version"])
+    return data
+
+
+async def get_stale_metadata_from_cache(media_id: str):
+    """Récupère une entrée de métadonnées même expirée, tant qu'elle est dans la fenêtre METADATA_STALE_GRACE."""
+    check_deadline(f"la lecture de {media_id} en cache")
+    oldest = time.time() - settings.METADATA_STALE_GRACE
+    query = "SELECT media_id, media_data, media_blob FROM metadata WHERE media_id = :media_id AND expires_at > :oldest"
+    result = await database.fetch_one(query, {"media_id": media_id, "oldest": oldest})
+    return _decode_metadata_row(result) if result else None
+
+
+async def get_many_metadata_from_cache(media_ids: list, chunk_size: int = 500) -> dict:
+    """Récupère plusieurs entrées de métadonnées valides en quelques requêtes IN. Retourne {media_id: données}."""
+    current_time = time.time()
+    results = {}
+    for i in range(0, len(media_ids), chunk_size):
+        chunk = media_ids[i:i + chunk_size]
+        binds = {f"media_id_{j}": media_id for j, media_id in enumerate(chunk)}
+        placeholders = ", ".join(f":{name}" for name in binds)
+        query = f"SELECT media_id, media_data, media_blob FROM metadata WHERE media_id IN ({placeholders}) AND expires_at > :current_time"
+        rows = await database.fetch_all(query, {**binds, "current_time": current_time})
+        for row in rows:
+            data = _decode_metadata_row(row)
+            if data is not None:
+                results[row["media_id"]] = data
+    return results
+
+
+async def get_metadata_expirations(media_ids: list, chunk_size: int = 500) -> dict:
+    """Date d'expiration des entrées de métadonnées encore valides. Retourne {media_id: expires_at}."""
+    current_time = time.time()
+    results = {}
+    for i in range(0, len(media_ids), chunk_size):
+        chunk = media_ids[i:i + chunk_size]
+        binds = {f"media_id_{j}": media_id for j, media_id in enumerate(chunk)}
+        placeholders = ", ".join(f":{name}" for name in binds)
+        query = f"SELECT media_id, expires_at FROM metadata WHERE media_id IN ({placeholders}) AND expires_at > :current_time"
+        rows = await database.fetch_all(query, {**binds, "current_time": current_time})
+        results.update((row["media_id"], row["expires_at"]) for row in rows)
+    return results
+
+
+def metadata_ttl() -> float:
+    """Durée de vie par défaut d'une entrée de métadonnées, avec une gigue pour étaler les expirations."""
+    jitter = max(0.0, min(settings.METADATA_TTL_JITTER, 1.0))
+    return settings.METADATA_TTL * random.uniform(1 - jitter, 1 + jitter)
+
+
+async def get_metadata_version(media_id: str, allow_stale: bool = False):
+    """
+    Retourne l'horodatage d'écriture d'une entrée de métadonnées valide, sans décoder son contenu.
+    Avec `allow_stale`, une entrée expirée encore dans la fenêtre METADATA_STALE_GRACE est acceptée.
+    """
+    cached = await metadata_l1_cache.get(media_id)
+    if cached is not None:
+        return cached[1]
+    check_deadline(f"la lecture de la version de {media_id}")
+    current_time = time.time()
+    oldest = current_time - settings.METADATA_STALE_GRACE if allow_stale else current_time
+    query = "SELECT timestamp FROM metadata WHERE media_id = :media_id AND expires_at > :oldest"
+    return await database.fetch_val(query, {"media_id": media_id, "oldest": oldest})
 
 
 async def set_metadata_to_cache(media_id: str, data, ttl: int = None):
     """Stocke les métadonnées dans le cache."""
     current_time = time.time()
-    expires_at = current_time + (ttl if ttl is not None else settings.METADATA_TTL)
+    expires_at = current_time + (ttl if ttl is not None else metadata_ttl())
+    query = (
+        "INSERT INTO metadata (media_id, media_data, media_blob, timestamp, expires_at, version) VALUES (:media_id, NULL, :media_blob, :timestamp, :expires_at, 1)"
+        " ON CONFLICT (media_id) DO UPDATE SET media_data = NULL, media_blob = :media_blob, timestamp = :timestamp, expires_at = :expires_at, version = metadata.version + 1"
+        " RETURNING version"
+    )
+    values = {"media_id": media_id, "media_blob": encode_cache_value(data), "timestamp": current_time, "expires_at": expires_at}
+    version = await database.fetch_val(query, values)
+    metadata_l1_cache.put(media_id, data, current_time, expires_at, version)
+
+
+async def get_many_debrid_from_cache(hashes: list, debrid_service: str, chunk_size: int = 500) -> dict:
+    """
+    Récupère en une requête IN par lot les statuts en cache de plusieurs hashes. Retourne {hash: {"status": ...}}.
+    Le statut est partagé par tous les épisodes et tous les utilisateurs d'un même service.
+    """
+    check_deadline("la lecture du cache de disponibilite")
+    current_time = time.time()
+    results = {}
+    for i in range(0, len(hashes), chunk_size):
+        chunk = hashes[i:i + chunk_size]
+        binds = {f"hash_{j}": hash for j, hash in enumerate(chunk)}
+        placeholders = ", ".join(f":{name}" for name in binds)
+        query = f"SELECT hash, status FROM debrid_availability WHERE debrid_service = :debrid_service AND hash IN ({placeholders}) AND (expires_at IS NULL OR expires_at > :current_time)"
+        rows = await database.fetch_all(query, {**binds, "debrid_service": debrid_service, "current_time": current_time})
+        for row in rows:
+            results[row["hash"]] = {"status": row["status"]}
+    return results
+
+
+async def save_many_debrid_to_cache(statuses: dict, debrid_service: str, chunk_size: int = 500):
+    """
+    Sauvegarde plusieurs statuts {hash: statut} en un seul upsert multi-lignes, dans une transaction.
+    La durée de vie de chaque ligne dépend de son statut (voir AvailabilityCachePolicy).
+    """
+    if not statuses:
+        return
+    current_time = time.time()
+    rows = [
+        {"hash": hash, "debrid_service": debrid_service, "status": status, "timestamp": current_time, "expires_at": current_time + availability_policy.ttl(status)}
+        for hash, status in statuses.items()
+    ]
+    async with database.transaction():
+        if settings.DATABASE_TYPE == "sqlite":
+            query = "INSERT OR REPLACE INTO debrid_availability (hash, debrid_service, status, timestamp, expires_at) VALUES (:hash, :debrid_service, :status, :timestamp, :expires_at)"
+            await database.execute_many(query, rows)
+            return
+        for i in range(0, len(rows), chunk_size):
+            binds, tuples = {}, []
+            for j, row in enumerate(rows[i:i + chunk_size]):
+                tuples.append(f"(:hash_{j}, :debrid_service_{j}, :status_{j}, :timestamp_{j}, :expires_at_{j})")
+                binds.update({f"{column}_{j}": value for column, value in row.items()})
+            query = (
+                "INSERT INTO debrid_availability (hash, debrid_service, status, timestamp, expires_at) VALUES "
+                + ", ".join(tuples)
+                + " ON CONFLICT (hash, debrid_service) DO UPDATE SET status = EXCLUDED.status, timestamp = EXCLUDED.timestamp, expires_at = EXCLUDED.expires_at"
+            )
+            await database.execute(query, binds)
+
+
+async def get_debrid_from_cache(hash: str, debrid_service: str):
+    """Récupère le statut de disponibilité debrid d'un hash depuis le cache."""
+    return (await get_many_debrid_from_cache([hash], debrid_service)).get(hash)
+
+
+async def save_debrid_to_cache(hash: str, debrid_service: str, status: str):
+    """Sauvegarde le statut de disponibilité debrid d'un hash dans le cache."""
+    await save_many_debrid_to_cache({hash: status}, debrid_service)
+
+
+async def get_account_status_from_cache(token_hash: str):
+    """Retourne (is_premium, expires_at) pour l'empreinte d'un jeton debrid, ou None."""
+    check_deadline("la lecture du statut premium en cache")
+    current_time = time.time()
+    query = "SELECT is_premium, expires_at FROM account_status WHERE token_hash = :token_hash AND expires_at > :current_time"
+    result = await database.fetch_one(query, {"token_hash": token_hash, "current_time": current_time})
+    return (bool(result["is_premium"]), result["expires_at"]) if result else None
+
+
+async def save_account_status_to_cache(token_hash: str, is_premium: bool, ttl: float):
+    """Sauvegarde le statut premium associé à l'empreinte d'un jeton debrid."""
+    current_time = time.time()
     if settings.DATABASE_TYPE == "sqlite":
-        query = "INSERT OR REPLACE INTO metadata (media_id, media_data, timestamp, expires_at) VALUES (:media_id, :media_data, :timestamp, :expires_at)"
+        query = "INSERT OR REPLACE INTO account_status (token_hash, is_premium, timestamp, expires_at) VALUES (:token_hash, :is_premium, :timestamp, :expires_at)"
     else:
-        query = "INSERT INTO metadata (media_id, media_data, timestamp, expires_at) VALUES (:media_id, :media_data, :timestamp, :expires_at) ON CONFLICT (media_id) DO UPDATE SET media_data = :media_data, timestamp = :timestamp, expires_at = :expires_at"
-    values = {"media_id": media_id, "media_data": json.dumps(data), "timestamp": current_time, "expires_at": expires_at}
+        query = "INSERT INTO account_status (token_hash, is_premium, timestamp, expires_at) VALUES (:token_hash, :is_premium, :timestamp, :expires_at) ON CONFLICT (token_hash) DO UPDATE SET is_premium = :is_premium, timestamp = :timestamp, expires_at = :expires_at"
+    values = {"token_hash": token_hash, "is_premium": is_premium, "timestamp": current_time, "expires_at": current_time + ttl}
     await database.execute(query, values)
 
 
-async def get_debrid_from_cache(media_id: str, hash: str, debrid_service: str):
-    """Récupère le statut de disponibilité debrid depuis le cache."""
+async def claim_magnet_job(hash: str, debrid_service: str, owner: str, lease: float) -> bool:
+    """
+    Réserve le suivi d'un magnet pour ce worker. Une tâche dont le bail a expiré
+    (worker arrêté ou tâche terminée) peut être reprise.
+    Retourne True si la tâche appartient à `owner`.
+    """
     current_time = time.time()
-    query = "SELECT status FROM debrid_availability WHERE media_id = :media_id AND hash = :hash AND debrid_service = :debrid_service AND (expires_at IS NULL OR expires_at > :current_time)"
-    values = {"media_id": media_id, "hash": hash, "debrid_service": debrid_service, "current_time": current_time}
-    result = await database.fetch_one(query, values)
-    return {"status": result["status"]} if result else None
+    query = (
+        "INSERT INTO magnet_jobs (hash, debrid_service, owner, status, magnet_status, attempts, next_check, timestamp, lease_expires_at) "
+        "VALUES (:hash, :debrid_service, :owner, 'pending', NULL, 0, :current_time, :current_time, :lease_expires_at) "
+        "ON CONFLICT (hash, debrid_service) DO UPDATE SET owner = excluded.owner, status = excluded.status, magnet_status = NULL, "
+        "attempts = 0, next_check = excluded.next_check, timestamp = excluded.timestamp, lease_expires_at = excluded.lease_expires_at "
+        "WHERE magnet_jobs.lease_expires_at < :current_time"
+    )
+    values = {"hash": hash, "debrid_service": debrid_service, "owner": owner, "current_time": current_time, "lease_expires_at": current_time + lease}
+    await database.execute(query, values)
+    result = await database.fetch_one("SELECT owner FROM magnet_jobs WHERE hash = :hash AND debrid_service = :debrid_service", {"hash": hash, "debrid_service": debrid_service})
+    return bool(result) and result["owner"] == owner
+
+
+async def update_magnet_job(hash: str, debrid_service: str, owner: str, status: str, magnet_status: Optional[str], attempts: int, next_check: Optional[float], lease_expires_at: float):
+    """Met à jour l'avancement d'une tâche de suivi, si elle appartient toujours à `owner`."""
+    query = (
+        "UPDATE magnet_jobs SET status = :status, magnet_status = :magnet_status, attempts = :attempts, next_check = :next_check, "
+        "timestamp = :timestamp, lease_expires_at = :lease_expires_at WHERE hash = :hash AND debrid_service = :debrid_service AND owner = :owner"
+    )
+    values = {
+        "hash": hash, "debrid_service": debrid_service, "owner": owner, "status": status, "magnet_status": magnet_status,
+        "attempts": attempts, "next_check": next_check, "timestamp": time.time(), "lease_expires_at": lease_expires_at,
+    }
+    await database.execute(query, values)
 
 
-async def save_debrid_to_cache(media_id: str, hash: str, debrid_service: str, status: str):
-    """Sauvegarde le statut de disponibilité debrid dans le cache."""
-    current_time = time.time()
-    expires_at = current_time + settings.DEBRID_AVAILABILITY_TTL
-    if settings.DATABASE_TYPE == "sqlite":
-        query = "INSERT OR REPLACE INTO debrid_availability (media_id, hash, debrid_service, status, timestamp, expires_at) VALUES (:media_id, :hash, :debrid_service, :status, :timestamp, :expires_at)"
-    else:
-        query = "INSERT INTO debrid_availability (media_id, hash, debrid_service, status, timestamp, expires_at) VALUES (:media_id, :hash, :debrid_service, :status, :timestamp, :expires_at) ON CONFLICT (media_id, hash, debrid_service) DO UPDATE SET status = :status, timestamp = :timestamp, expires_at = :expires_at"
-    values = {"media_id": media_id, "hash": hash, "debrid_service": debrid_service, "status": status, "timestamp": current_time, "expires_at": expires_at}
-    await database.execute(query, values)
+async def get_magnet_job(hash: str, debrid_service: str) -> Optional[dict]:
+    """Retourne l'état de la tâche de suivi d'un magnet, ou None."""
+    columns = ("status", "magnet_status", "attempts", "next_check", "timestamp", "lease_expires_at")
+    query = f"SELECT {', '.join(columns)} FROM magnet_jobs WHERE hash = :hash AND debrid_service = :debrid_service"
+    result = await database.fetch_one(query, {"hash": hash, "debrid_service": debrid_service})
+    return {column: result[column] for column in columns} if result else None
 
 
+# Identifiant unique de ce processus, préfixe des propriétaires de verrous et de tâches
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Backoff entre deux tentatives d'acquisition (secondes) : une libération réveille l'attente immédiatement
+LOCK_RETRY_MIN_DELAY = 0.05
+LOCK_RETRY_MAX_DELAY = 1.0
+# Avec l'écoute Postgres, les tentatives périodiques ne servent qu'à reprendre les verrous expirés
+LOCK_NOTIFIED_RETRY_DELAY = 5.0
+
+
+def new_lock_owner_id() -> str:
+    """Identifiant de propriétaire unique pour un verrou pris par ce processus."""
+    return f"{PROCESS_ID}:{uuid.uuid4().hex[:12]}"
+
 
 async def acquire_lock(lock_key: str, instance_id: str, duration: int = None) -> bool:
     """
@@ -160,12 +513,14 @@ async def acquire_lock(lock_key: str, instance_id: str, duration: int = None) ->
                 deleted = await database.execute("DELETE FROM scrape_lock WHERE lock_key = :lock_key AND expires_at < :current_time", {"lock_key": lock_key, "current_time": current_time})
                 return await acquire_lock(lock_key, instance_id, duration) if deleted else False
             if existing_lock["instance_id"] == instance_id:
+                lock_notifier.mark_held(lock_key)
                 logger.log("LOCK", f"✅ Verrou acquis: {lock_key}")
                 return True
             else:
                 logger.log("LOCK", f"❌ Verrou deja detenu par une autre instance: {lock_key}")
                 return False
         
+        lock_notifier.mark_held(lock_key)
         logger.log("LOCK", f"✅ Verrou acquis: {lock_key}")
         return True
     except Exception as e:
@@ -175,40 +530,72 @@ async def acquire_lock(lock_key: str, instance_id: str, duration: int = None) ->
 
 async def release_lock(lock_key: str, instance_id: str) -> bool:
     """
-    Libère un verrou distribué pour la clé donnée.
+    Libère un verrou distribué pour la clé donnée et réveille les attentes :
+    celles du processus directement, celles des autres processus par NOTIFY (Postgres).
     Retourne True si le verrou est libéré, False s'il n'appartient pas à cette instance.
     """
     try:
-        await database.execute("DELETE FROM scrape_lock WHERE lock_key = :lock_key AND instance_id = :instance_id", {"lock_key": lock_key, "instance_id": instance_id})
+        deleted = await database.fetch_val(
+            "DELETE FROM scrape_lock WHERE lock_key = :lock_key AND instance_id = :instance_id RETURNING lock_key",
+            {"lock_key": lock_key, "instance_id": instance_id},
+        )
+        if deleted is None:
+            logger.log("LOCK", f"⚠️ Verrou {lock_key} non libere: il n'appartient pas a cette instance ou a expire")
+            return False
+        if settings.DATABASE_TYPE != "sqlite":
+            await database.execute("SELECT pg_notify(:channel, :lock_key)", {"channel": LOCK_RELEASE_CHANNEL, "lock_key": lock_key})
         logger.log("LOCK", f"🔓 Verrou libere: {lock_key}")
         return True
     except Exception as e:
         logger.warning(f"Echec de la liberation du verrou {lock_key}: {e}")
         return False
+    finally:
+        # Même en cas d'échec, les attentes du processus ne doivent pas croire le verrou encore détenu ici
+        lock_notifier.mark_released(lock_key)
 
 
 class DistributedLock:
-    """Gestionnaire de contexte pour le verrouillage distribué."""
+    """
+    Gestionnaire de contexte pour le verrouillage distribué.
+    L'attente reprend dès la libération du verrou (événement local ou NOTIFY Postgres) ;
+    les nouvelles tentatives espacées par backoff couvrent les verrous expirés et SQLite entre processus.
+    """
     def __init__(self, lock_key: str, instance_id: str = None, duration: int = None):
         self.lock_key = lock_key
-        self.instance_id = instance_id or f"fkstream_{int(time.time())}"
+        self.instance_id = instance_id or new_lock_owner_id()
         self.duration = duration if duration is not None else settings.SCRAPE_LOCK_TTL
         self.acquired = False
     
     async def __aenter__(self):
         start_time = time.time()
-        timeout = settings.SCRAPE_WAIT_TIMEOUT
+        # L'attente ne dépasse pas l'échéance de la requête en cours
+        timeout = bounded_timeout(settings.SCRAPE_WAIT_TIMEOUT)
+        delay = LOCK_RETRY_MIN_DELAY
         
-        while time.time() - start_time < timeout:
-            self.acquired = await acquire_lock(self.lock_key, self.instance_id, self.duration)
-            if self.acquired:
-                logger.log("LOCK", f"✅ Verrou acquis pour {self.lock_key} apres {time.time() - start_time:.2f}s d'attente.")
-                return self
-            
-            logger.log("LOCK", f"⏳ Attente du verrou {self.lock_key}...")
-            await asyncio.sleep(1)
+        while True:
+            # Attente enregistrée avant la tentative, pour ne pas manquer une libération intermédiaire
+            event = lock_notifier.waiter(self.lock_key)
+            try:
+                # Verrou détenu par ce processus : inutile d'interroger la base, la libération réveillera l'attente
+                if not lock_notifier.held_locally(self.lock_key):
+                    self.acquired = await acquire_lock(self.lock_key, self.instance_id, self.duration)
+                    if self.acquired:
+                        logger.log("LOCK", f"✅ Verrou acquis pour {self.lock_key} apres {time.time() - start_time:.2f}s d'attente.")
+                        return self
+
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                logger.log("LOCK", f"⏳ Attente du verrou {self.lock_key}...")
+                retry_delay = LOCK_NOTIFIED_RETRY_DELAY if lock_notifier.listening else delay
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(retry_delay, remaining))
+                except asyncio.TimeoutError:
+                    delay = min(delay * 2, LOCK_RETRY_MAX_DELAY)
+            finally:
+                lock_notifier.discard(self.lock_key, event)
             
-        raise LockAcquisitionError(f"Impossible d'acquerir le verrou {self.lock_key} apres {timeout}s")
+        raise LockAcquisitionError(f"Impossible d'acquerir le verrou {self.lock_key} apres {timeout:.1f}s")
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.acquired:
@@ -223,6 +610,7 @@ class LockAcquisitionError(Exception):
 async def teardown_database():
     """Ferme la connexion à la base de données."""
     try:
+        await lock_notifier.stop()
         await database.disconnect()
     except Exception as e:
         logger.error(f"Erreur lors de la fermeture de la base de donnees: {e}")
@@ -0,0 +1,117 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+import orjson
+
+from fkstream.utils.common_logger import logger
+
+# Extraction du hash BitTorrent depuis un lien magnet
+INFO_HASH_PATTERN = re.compile(r'btih:([a-fA-F0-9]{40})')
+
+
+@dataclass(frozen=True, slots=True)
+class DatasetSource:
+    """Torrent du dataset avec son hash déjà extrait."""
+    hash: str
+    magnet: str
+    type: Optional[str]
+    files: Tuple[str, ...]
+    size: int = 0
+    seeders: Optional[int] = None
+
+
+@dataclass(frozen=True, slots=True)
+class DatasetEntry:
+    """Anime du dataset et ses torrents pré-analysés."""
+    api_id: str
+    name: Optional[str]
+    slug: Optional[str]
+    sources: Tuple[DatasetSource, ...]
+    hashes: Tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class DatasetSnapshot:
+    """
+    Vue immuable et versionnée du dataset local.
+    Construite une seule fois par chargement pour que les requêtes ne fassent que des recherches O(1).
+    """
+    version: str
+    entries: Mapping[str, DatasetEntry] = field(default_factory=lambda: MappingProxyType({}))
+    api_ids: frozenset = frozenset()
+
+    def get(self, api_id) -> Optional[DatasetEntry]:
+        """Retourne l'entrée du dataset pour un api_id, ou None."""
+        return self.entries.get(str(api_id))
+
+    def __contains__(self, api_id) -> bool:
+        return str(api_id) in self.api_ids
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+EMPTY_DATASET = DatasetSnapshot(version="empty")
+
+
+def _parse_source(source: dict) -> Optional[DatasetSource]:
+    """Analyse une source du dataset, retourne None si le magnet est invalide."""
+    magnet = source.get('magnet')
+    if not magnet:
+        return None
+    info_hash_match = INFO_HASH_PATTERN.search(magnet)
+    if not info_hash_match:
+        return None
+    return DatasetSource(
+        hash=info_hash_match.group(1).lower(),
+        magnet=magnet,
+        type=source.get('type'),
+        files=tuple(source.get('files') or ()),
+        size=source.get('size') or 0,
+        seeders=source.get('seeders'),
+    )
+
+
+def build_dataset_snapshot(raw_dataset: dict) -> DatasetSnapshot:
+    """
+    Construit un instantané immuable à partir du dataset brut.
+    La version est dérivée du contenu : recharger un dataset identique conserve la même version.
+    """
+    canonical = orjson.dumps(raw_dataset, option=orjson.OPT_SORT_KEYS)
+    version = hashlib.blake2b(canonical, digest_size=8).hexdigest()
+
+    entries = {}
+    for anime in raw_dataset.get('top', []):
+        api_id = anime.get('api_id')
+        if api_id is None:
+            continue
+        api_id = str(api_id)
+        sources = tuple(
+            parsed for parsed in (_parse_source(source) for source in anime.get('sources', []))
+            if parsed is not None
+        )
+        if api_id in entries:
+            logger.warning(f"api_id {api_id} en double dans le dataset, les sources sont fusionnees.")
+            previous = entries[api_id]
+            sources = previous.sources + sources
+        entries[api_id] = DatasetEntry(
+            api_id=api_id,
+            name=anime.get('name'),
+            slug=anime.get('id'),
+            sources=sources,
+            hashes=tuple(source.hash for source in sources),
+        )
+
+    return DatasetSnapshot(
+        version=version,
+        entries=MappingProxyType(entries),
+        api_ids=frozenset(entries),
+    )
+
+
+def load_dataset_snapshot(raw_bytes: bytes) -> DatasetSnapshot:
+    """Décode un dataset JSON et en construit l'instantané."""
+    return build_dataset_snapshot(orjson.loads(raw_bytes))
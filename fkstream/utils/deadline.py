@@ -0,0 +1,97 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Échéance de la requête en cours (horloge monotone), None hors requête ou pour une tâche de fond
+_deadline: ContextVar[Optional[float]] = ContextVar("fkstream_deadline", default=None)
+
+# En dessous de ce budget, un appel réseau n'est plus lancé : il n'aurait pas le temps d'aboutir
+MIN_CALL_BUDGET = 0.1
+
+
+class DeadlineExceeded(TimeoutError):
+    """Le budget de temps de la requête en cours est épuisé."""
+
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance de la requête en cours, ou None sans échéance."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(what: str = "operation") -> None:
+    """Lève DeadlineExceeded si le budget restant ne permet plus de lancer `what`."""
+    left = remaining()
+    if left is not None and left < MIN_CALL_BUDGET:
+        raise DeadlineExceeded(f"Budget de temps epuise avant {what}")
+
+
+def bounded_timeout(default: float) -> float:
+    """Délai d'un appel : `default`, réduit au budget restant de la requête en cours."""
+    left = remaining()
+    return default if left is None else max(0.0, min(default, left))
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """
+    Fixe l'échéance des appels faits dans ce contexte à `seconds` à partir de maintenant.
+    Une échéance englobante plus proche est conservée.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def reserve(seconds: float):
+    """Avance l'échéance de `seconds`, pour garder le temps de construire la réponse après les appels."""
+    current = _deadline.get()
+    token = _deadline.set(None if current is None else current - seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def detach() -> None:
+    """
+    Retire l'échéance du contexte courant. À appeler au début d'une tâche de fond lancée depuis une requête :
+    la tâche hérite sinon de l'échéance de la requête qui l'a créée.
+    """
+    _deadline.set(None)
+
+
+def with_deadline(seconds: float):
+    """Décorateur d'endpoint : chaque appel s'exécute avec une échéance de `seconds`."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with request_deadline(seconds):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def wait_within_deadline(awaitable: Awaitable[T]) -> T:
+    """Attend `awaitable` au plus le budget restant ; lève DeadlineExceeded au-delà (l'attente est annulée)."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, left))
+    except asyncio.TimeoutError:
+        if (remaining() or 0) > 0:
+            raise
+        raise DeadlineExceeded("Budget de temps epuise pendant l'attente") from None
@@ -1,15 +1,157 @@
 import logging
 import httpx
 import asyncio
+import random
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Collection, Dict, Optional, Tuple
+from urllib.parse import urlparse
 
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .deadline import MIN_CALL_BUDGET, DeadlineExceeded, remaining
 from .models import settings
 from .http_constants import DEFAULT_USER_AGENT, JSON_HEADERS
 from .base_client import BaseClient
 
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # dépendance optionnelle : pip install fkstream[http2]
+    HTTP2_AVAILABLE = False
+
+# Durée maximale du préchauffage des connexions au démarrage (secondes)
+PREWARM_TIMEOUT = 5.0
+
+# Méthodes qui peuvent être rejouées sans effet de bord
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Budget de nouvelles tentatives : chaque requête crédite RETRY_BUDGET_RATIO jeton, chaque nouvelle tentative en coûte un
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX_TOKENS = 10.0
+
+
+@dataclass(frozen=True, slots=True)
+class RetryPolicy:
+    """Politique de nouvelles tentatives d'un upstream."""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 4.0
+    retry_statuses: frozenset = frozenset({429, 500, 502, 503, 504})
+    # Au-delà, un Retry-After n'est pas attendu : l'erreur est remontée tout de suite
+    max_retry_after: float = 10.0
+
+    def backoff(self, attempt: int) -> float:
+        """Délai avant la tentative suivante : backoff exponentiel avec gigue complète."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class RetryBudget:
+    """
+    Seau à jetons limitant les nouvelles tentatives à une fraction du trafic d'un upstream,
+    pour ne pas amplifier la charge d'un service déjà en difficulté.
+    """
+
+    def __init__(self, name: str, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MAX_TOKENS):
+        self.name = name
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_request(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Consomme un jeton pour une nouvelle tentative. False si le budget est épuisé."""
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": round(self.tokens, 2), "retries": self.retries, "exhausted": self.exhausted}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Délai d'un en-tête Retry-After (secondes ou date HTTP), ou None s'il est absent ou illisible."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class ClientProfile:
+    """Réglages du pool de connexions d'un upstream."""
+    name: str
+    hosts: Tuple[str, ...]
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    connect_timeout: float
+    read_timeout: float
+    use_proxy: bool = False
+    http2: bool = False
+    prewarm_url: Optional[str] = None
+    prewarm_connections: int = 0
+    retry: RetryPolicy = RetryPolicy()
+    circuit_breaker: bool = False
+    # Requêtes simultanées par worker, comptées par tentative (0 : pas de limite) ; avec HTTP/2, max_connections ne les borne pas
+    max_concurrency: int = 0
+
+
+def _host(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+def build_client_profiles() -> Dict[str, ClientProfile]:
+    """
+    Profils par upstream : chaque pool est isolé, pour que les appels lents aux métadonnées
+    ne retardent pas ceux de StremThru. Seul le trafic debrid passe par DEBRID_PROXY_URL.
+    """
+    stremthru_url = settings.STREMTHRU_URL.rstrip("/")
+    return {
+        "stremthru": ClientProfile(
+            name="stremthru", hosts=(_host(stremthru_url),),
+            max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0,
+            connect_timeout=5.0, read_timeout=20.0,
+            use_proxy=True, http2=True, prewarm_url=f"{stremthru_url}/v0/health", prewarm_connections=4,
+            retry=RetryPolicy(max_attempts=3, base_delay=0.25, max_delay=2.0), circuit_breaker=True,
+        ),
+        "fankai": ClientProfile(
+            name="fankai", hosts=("metadata.fankai.fr",),
+            max_connections=16, max_keepalive_connections=8, keepalive_expiry=30.0,
+            connect_timeout=5.0, read_timeout=15.0,
+            http2=True, prewarm_url="https://metadata.fankai.fr/", prewarm_connections=2,
+            retry=RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0), circuit_breaker=True,
+            max_concurrency=settings.FANKAI_MAX_CONCURRENCY,
+        ),
+        "github": ClientProfile(
+            name="github", hosts=("raw.githubusercontent.com",),
+            max_connections=4, max_keepalive_connections=2, keepalive_expiry=30.0,
+            connect_timeout=5.0, read_timeout=30.0,
+            http2=True,
+            retry=RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0, max_retry_after=30.0),
+        ),
+    }
+
 
 class HttpClient(BaseClient):
     """
     Client HTTP unifié avec configuration commune, nouvelles tentatives automatiques et gestion d'erreurs.
+    Chaque upstream connu (StremThru, Fankai, GitHub) a son propre pool de connexions ;
+    les autres hôtes utilisent un pool par défaut.
     """
     
     def __init__(self, base_url: str = "", timeout: float = 15.0, retries: int = 3, user_agent: str = None):
@@ -19,82 +161,226 @@ class HttpClient(BaseClient):
         self.retries = retries
         self.logger = logging.getLogger(f"http_client.{base_url}")
         self.user_agent = user_agent or DEFAULT_USER_AGENT
+        self.profiles = build_client_profiles()
+        self._profile_by_host = {host: profile for profile in self.profiles.values() for host in profile.hosts}
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.default_retry = RetryPolicy(max_attempts=max(1, retries))
+        self._budgets = {name: RetryBudget(name) for name in [*self.profiles, "default"]}
+        self.breakers = {
+            name: CircuitBreaker(name, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD, settings.CIRCUIT_BREAKER_RESET_TIMEOUT)
+            for name, profile in self.profiles.items() if profile.circuit_breaker
+        }
+        self._slots = {
+            name: asyncio.Semaphore(profile.max_concurrency)
+            for name, profile in self.profiles.items() if profile.max_concurrency > 0
+        }
         self._setup_client()
     
     def _setup_client(self):
-        """Configure le client HTTP avec les options appropriées."""
+        """Configure le client HTTP par défaut avec les options appropriées."""
+        self.client = self._build_client(None)
+    
+    def _build_client(self, profile: Optional[ClientProfile]) -> httpx.AsyncClient:
+        """Construit le client d'un profil (None : pool par défaut, sans proxy)."""
         headers = JSON_HEADERS.copy()
         headers["User-Agent"] = self.user_agent
-        
-        proxy = settings.DEBRID_PROXY_URL if settings.DEBRID_PROXY_URL else None
-        
-        self.client = httpx.AsyncClient(
-            timeout=httpx.Timeout(self.timeout),
+
+        if profile is None:
+            return httpx.AsyncClient(timeout=httpx.Timeout(self.timeout), headers=headers, follow_redirects=True)
+
+        proxy = settings.DEBRID_PROXY_URL if profile.use_proxy and settings.DEBRID_PROXY_URL else None
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(profile.read_timeout, connect=profile.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=profile.max_connections,
+                max_keepalive_connections=profile.max_keepalive_connections,
+                keepalive_expiry=profile.keepalive_expiry,
+            ),
             headers=headers,
             follow_redirects=True,
-            proxy=proxy
+            proxy=proxy,
+            http2=profile.http2 and HTTP2_AVAILABLE,
         )
     
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        """Client du pool correspondant à l'hôte de l'URL, recréé s'il a été fermé."""
+        profile = self._profile_by_host.get(_host(url))
+        if profile is None:
+            if self.is_closed:
+                self._setup_client()
+            return self.client
+        client = self.clients.get(profile.name)
+        if client is None or client.is_closed:
+            client = self.clients[profile.name] = self._build_client(profile)
+        return client
+    
     @property
     def is_closed(self) -> bool:
         """Vérifie si le client est fermé."""
         return self.client is None or self.client.is_closed
     
+    async def prewarm(self):
+        """
+        Ouvre à l'avance les connexions (DNS, TCP, TLS) des upstreams qui le demandent,
+        pour que les premières requêtes n'en paient pas le coût. Les réponses sont ignorées.
+        """
+        async def open_connection(profile: ClientProfile):
+            try:
+                await self._client_for(profile.prewarm_url).head(profile.prewarm_url)
+            except Exception as e:
+                self.logger.debug(f"Prechauffage de {profile.name} impossible: {e}")
+
+        tasks = [
+            open_connection(profile)
+            for profile in self.profiles.values() if profile.prewarm_url
+            for _ in range(profile.prewarm_connections)
+        ]
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout=PREWARM_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Prechauffage des connexions incomplet apres {PREWARM_TIMEOUT}s")
+    
+    async def close(self):
+        """Ferme tous les pools de connexions."""
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+        await super().close()
+    
     async def get(self, url: str, **kwargs) -> httpx.Response:
         """Effectue une requête GET avec nouvelles tentatives automatiques."""
         return await self._request("GET", url, **kwargs)
     
     async def post(self, url: str, **kwargs) -> httpx.Response:
-        """Effectue une requête POST avec nouvelles tentatives automatiques."""
+        """
+        Effectue une requête POST. Elle n'est retentée après envoi que si `idempotent=True` est passé.
+        """
         return await self._request("POST", url, **kwargs)
     
-    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+    async def _request(self, method: str, url: str, idempotent: Optional[bool] = None, accept_statuses: Collection[int] = (), **kwargs) -> httpx.Response:
         """
-        Effectue une requête HTTP avec une logique de nouvelles tentatives et une gestion des erreurs.
+        Effectue une requête HTTP avec la politique de nouvelles tentatives de l'hôte : backoff exponentiel
+        avec gigue complète, respect de Retry-After (429/503) et budget de nouvelles tentatives.
+        Une requête non idempotente (POST par défaut) n'est retentée que si elle n'a pas atteint le serveur
+        ou a été refusée par un 429 ; `idempotent=True` lève cette restriction.
+        Sous une échéance (voir deadline.py), les délais de chaque tentative sont réduits au budget restant
+        et aucune tentative n'est lancée ou attendue au-delà.
+        Les codes de `accept_statuses` (ex. 304 d'un GET conditionnel) sont retournés tels quels, comme un succès.
         """
         if not url.startswith('http'):
             url = f"{self.base_url.rstrip('/')}/{url.lstrip('/')}"
         
-        last_exception = None
+        profile = self._profile_by_host.get(_host(url))
+        policy = profile.retry if profile else self.default_retry
+        budget = self._budgets[profile.name if profile else "default"]
+        breaker = self.breakers.get(profile.name) if profile else None
+        # Emplacement pris pour la seule durée de chaque tentative, jamais pendant les attentes entre tentatives
+        slot = self._slots.get(profile.name, nullcontext()) if profile else nullcontext()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        budget.record_request()
+        read_timeout = profile.read_timeout if profile else self.timeout
+        connect_timeout = profile.connect_timeout if profile else self.timeout
         
-        for attempt in range(self.retries):
+        attempt = 0
+        last_exception = None
+        while True:
+            attempt += 1
+            retry_after = None
+            time_left = remaining()
+            if time_left is not None and time_left < MIN_CALL_BUDGET:
+                if last_exception is not None:
+                    raise last_exception
+                raise DeadlineExceeded(f"Budget de temps epuise avant {method} {url}")
+            # Un délai réduit par l'échéance qui expire ne dit rien de la santé de l'upstream
+            clamped = time_left is not None and time_left < read_timeout
+            if time_left is not None:
+                kwargs["timeout"] = httpx.Timeout(min(read_timeout, time_left), connect=min(connect_timeout, time_left))
+            if breaker is not None and not breaker.allow():
+                if last_exception is not None:
+                    raise last_exception
+                raise CircuitOpenError(f"Disjoncteur {breaker.name} ouvert, requete {method} {url} refusee")
             try:
-                if self.is_closed:
-                    self._setup_client()
+                client = self._client_for(url)
                 
-                self.logger.debug(f"{method} {url} (tentative {attempt + 1}/{self.retries})")
+                self.logger.debug(f"{method} {url} (tentative {attempt}/{policy.max_attempts})")
                 
-                response = await self.client.request(method, url, **kwargs)
-                response.raise_for_status()
+                async with slot:
+                    response = await client.request(method, url, **kwargs)
+                if breaker is not None:
+                    # Un 4xx prouve que l'upstream répond : seuls les 5xx comptent comme des échecs
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                if response.status_code not in accept_statuses:
+                    response.raise_for_status()
                 
                 self.logger.debug(f"{method} {url} → {response.status_code}")
                 return response
                 
-            except httpx.TimeoutException as e:
-                last_exception = e
-                self.logger.warning(f"{method} {url} timeout (tentative {attempt + 1}/{self.retries})")
-                if attempt < self.retries - 1:
-                    await asyncio.sleep(1 * (attempt + 1))
-                    
             except httpx.HTTPStatusError as e:
                 last_exception = e
-                if e.response.status_code >= 500:
-                    self.logger.warning(f"{method} {url} → {e.response.status_code} (tentative {attempt + 1}/{self.retries})")
-                    if attempt < self.retries - 1:
-                        await asyncio.sleep(1 * (attempt + 1))
-                        continue
-                else:
-                    self.logger.error(f"{method} {url} → {e.response.status_code}")
+                status_code = e.response.status_code
+                if status_code not in policy.retry_statuses:
+                    self.logger.error(f"{method} {url} → {status_code}")
                     raise
+                self.logger.warning(f"{method} {url} → {status_code} (tentative {attempt}/{policy.max_attempts})")
+                retriable = idempotent or status_code == 429
+                if status_code in (429, 503):
+                    retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
                     
-            except Exception as e:
+            except httpx.PoolTimeout as e:
+                # Attente d'une connexion libre du pool : la requête n'est pas partie, l'upstream n'est pas en cause
                 last_exception = e
-                self.logger.error(f"{method} {url} erreur: {str(e)} (tentative {attempt + 1}/{self.retries})")
-                if attempt < self.retries - 1:
-                    await asyncio.sleep(1 * (attempt + 1))
-        
-        self.logger.error(f"{method} {url} a echoue apres {self.retries} tentatives")
-        if last_exception:
-            raise last_exception
-        else:
-            raise httpx.RequestError(f"La requete a echoue apres {self.retries} tentatives")
+                self.logger.warning(f"{method} {url} aucune connexion disponible (tentative {attempt}/{policy.max_attempts})")
+                retriable = True
+                
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # La requête n'a pas atteint le serveur : elle peut être retentée quelle que soit la méthode
+                last_exception = e
+                if breaker is not None and not (clamped and isinstance(e, httpx.TimeoutException)):
+                    breaker.record_failure()
+                self.logger.warning(f"{method} {url} connexion impossible: {e!r} (tentative {attempt}/{policy.max_attempts})")
+                retriable = True
+                
+            except httpx.TransportError as e:
+                last_exception = e
+                if breaker is not None and not (clamped and isinstance(e, httpx.TimeoutException)):
+                    breaker.record_failure()
+                self.logger.warning(f"{method} {url} erreur: {e!r} (tentative {attempt}/{policy.max_attempts})")
+                retriable = idempotent
+            
+            if not retriable:
+                self.logger.error(f"{method} {url} non retentee (requete non idempotente)")
+                raise last_exception
+            if attempt >= policy.max_attempts:
+                self.logger.error(f"{method} {url} a echoue apres {attempt} tentatives")
+                raise last_exception
+            if retry_after is not None and retry_after > policy.max_retry_after:
+                self.logger.error(f"{method} {url} Retry-After de {retry_after:.0f}s trop long, abandon")
+                raise last_exception
+            delay = retry_after if retry_after is not None else policy.backoff(attempt)
+            time_left = remaining()
+            if time_left is not None and delay + MIN_CALL_BUDGET > time_left:
+                self.logger.error(f"{method} {url} abandon, echeance de la requete trop proche pour une nouvelle tentative")
+                raise last_exception
+            if not budget.try_spend():
+                self.logger.error(f"{method} {url} budget de nouvelles tentatives epuise pour {budget.name}")
+                raise last_exception
+            
+            await asyncio.sleep(delay)
+    
+    def retry_stats(self) -> dict:
+        """Compteurs des budgets de nouvelles tentatives, par upstream."""
+        return {name: budget.stats() for name, budget in self._budgets.items()}
+    
+    def circuit_open(self, url: str) -> bool:
+        """True si le disjoncteur de l'upstream de l'URL refuse actuellement les requêtes."""
+        profile = self._profile_by_host.get(_host(url))
+        breaker = self.breakers.get(profile.name) if profile else None
+        return breaker is not None and breaker.is_open
+    
+    def circuit_stats(self) -> dict:
+        """État des disjoncteurs, par upstream."""
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
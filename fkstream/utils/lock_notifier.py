@@ -0,0 +1,87 @@
+import asyncio
+from typing import Dict, Set
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.models import settings
+
+# Canal Postgres sur lequel les libérations de verrous sont annoncées (charge utile : clé du verrou)
+LOCK_RELEASE_CHANNEL = "fkstream_lock_release"
+
+
+class LockNotifier:
+    """
+    Réveil des attentes de verrous distribués dès la libération, au lieu d'une interrogation à intervalle fixe.
+    Dans le processus : un asyncio.Event par attente, déclenché par release_lock.
+    Entre processus (Postgres) : une connexion dédiée écoute les NOTIFY émis à chaque libération.
+    Sans Postgres, les autres processus ne sont pas notifiés et les attentes se rabattent sur un backoff.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._held: Set[str] = set()
+        self._connection = None
+
+    @property
+    def listening(self) -> bool:
+        """True si les libérations des autres processus sont reçues."""
+        return self._connection is not None and not self._connection.is_closed()
+
+    def waiter(self, lock_key: str) -> asyncio.Event:
+        """Enregistre une attente sur le verrou, à retirer avec discard()."""
+        event = asyncio.Event()
+        self._waiters.setdefault(lock_key, set()).add(event)
+        return event
+
+    def discard(self, lock_key: str, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(lock_key)
+        if waiters is None:
+            return
+        waiters.discard(event)
+        if not waiters:
+            del self._waiters[lock_key]
+
+    def wake(self, lock_key: str) -> None:
+        """Réveille toutes les attentes sur le verrou."""
+        for event in self._waiters.get(lock_key, ()):
+            event.set()
+
+    def held_locally(self, lock_key: str) -> bool:
+        """True si le verrou est détenu par ce processus : inutile alors d'interroger la base."""
+        return lock_key in self._held
+
+    def mark_held(self, lock_key: str) -> None:
+        self._held.add(lock_key)
+
+    def mark_released(self, lock_key: str) -> None:
+        self._held.discard(lock_key)
+        self.wake(lock_key)
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        self.wake(payload)
+
+    async def start(self) -> None:
+        """Ouvre la connexion d'écoute Postgres (sans effet avec SQLite)."""
+        if settings.DATABASE_TYPE == "sqlite" or self.listening:
+            return
+        try:
+            import asyncpg
+
+            self._connection = await asyncpg.connect(f"postgresql://{settings.DATABASE_URL}")
+            await self._connection.add_listener(LOCK_RELEASE_CHANNEL, self._on_notification)
+            logger.log("LOCK", f"✅ Ecoute des liberations de verrous sur le canal {LOCK_RELEASE_CHANNEL}")
+        except Exception as e:
+            logger.log("LOCK", f"⚠️ Ecoute des liberations de verrous impossible, attente par backoff: {e}")
+            self._connection = None
+
+    async def stop(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            await self._connection.close()
+        except Exception as e:
+            logger.log("LOCK", f"❌ Erreur lors de la fermeture de l'ecoute des verrous: {e}")
+        self._connection = None
+
+
+# Instance globale du processus
+lock_notifier = LockNotifier()
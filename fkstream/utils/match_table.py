@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.dataset import DatasetEntry
+from fkstream.utils.models import Episode
+from fkstream.utils.matcher import FileIndex
+from fkstream.utils.rename_map import RenameMap, rename_map_service
+
+
+@dataclass(frozen=True, slots=True)
+class EpisodeMatch:
+    """Fichier du dataset correspondant à un épisode."""
+    hash: str
+    file_index: int
+    filename: str
+    size: int = 0
+    seeders: Optional[int] = None
+
+
+class EpisodeMatchTable:
+    """
+    Table épisode -> (infoHash, fileIdx) calculée une seule fois par anime,
+    par version de dataset et par version des nfo_filename de l'anime.
+    Les échecs de matching sont mémorisés (tuple vide) pour ne pas être retentés à chaque requête.
+    """
+
+    def __init__(self):
+        self._tables: Dict[str, Tuple[tuple, Dict[str, Tuple[EpisodeMatch, ...]]]] = {}
+
+    @staticmethod
+    def _table_key(dataset_version: str, rename_map: RenameMap, episodes: List[Episode]) -> tuple:
+        """Clé de validité : version du dataset, de la liste de renommage et empreinte des nfo_filename."""
+        return dataset_version, rename_map.version, hash(tuple((episode.id, episode.nfo_filename) for episode in episodes))
+
+    def _build(self, entry: DatasetEntry, episodes: List[Episode], rename_map: RenameMap) -> Dict[str, Tuple[EpisodeMatch, ...]]:
+        """Calcule les correspondances de tous les épisodes de l'anime contre tous ses torrents."""
+        table = {episode.id: [] for episode in episodes}
+        for source in entry.sources:
+            # Un seul index par torrent, puis une recherche O(1) par épisode
+            file_index = FileIndex(source.files, rename_map)
+            for episode in episodes:
+                index = file_index.find(episode.nfo_filename, rename_map)
+                if index is not None:
+                    table[episode.id].append(EpisodeMatch(
+                        hash=source.hash,
+                        file_index=index,
+                        filename=source.files[index],
+                        size=source.size,
+                        seeders=source.seeders,
+                    ))
+        return {episode_id: tuple(matches) for episode_id, matches in table.items()}
+
+    def get_matches(self, dataset_version: str, entry: DatasetEntry, episodes: List[Episode], episode_id: str) -> Tuple[EpisodeMatch, ...]:
+        """Retourne les fichiers candidats pour un épisode, en reconstruisant la table de l'anime si nécessaire."""
+        rename_map = rename_map_service.current
+        key = self._table_key(dataset_version, rename_map, episodes)
+        cached = self._tables.get(entry.api_id)
+        if cached is None or cached[0] != key:
+            logger.info(f"Construction de la table de correspondance pour l'anime {entry.api_id} ({len(episodes)} episodes, {len(entry.sources)} torrents)")
+            table = self._build(entry, episodes, rename_map)
+            self._tables[entry.api_id] = (key, table)
+            unmatched = sum(1 for matches in table.values() if not matches)
+            if unmatched:
+                logger.warning(f"Table de correspondance {entry.api_id}: {unmatched}/{len(table)} episodes sans fichier")
+        else:
+            table = cached[1]
+        return table.get(episode_id, ())
+
+    def clear(self) -> None:
+        """Vide toutes les tables de correspondance."""
+        self._tables.clear()
@@ -0,0 +1,129 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Hashable, Mapping, Optional, Sequence
+
+from fkstream.utils.general import is_video
+from fkstream.utils.rename_map import RenameMap
+
+# --- Motifs précompilés ---
+
+BRACKETS_PATTERN = re.compile(r'\[.*?\]|\(.*?\)')
+RESOLUTION_PATTERN = re.compile(r'\b\d{3,4}p\b')
+NOISE_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(term) for term in (
+        'multi', 'vostfr', 'vf2', 'vf', 'vo', 'x264', 'x265', 'hevc', 'bluray', 'web-dl', 'webrip',
+        'bdrip', 'hdlight', 'dvdrip', 'remux', 'fan-cut', 'henshu', 'film', 'kai', 'yabai',
+    )) + r')\b'
+)
+SEPARATORS_PATTERN = re.compile(r"[.\-_|']")
+SEASON_EPISODE_PATTERN = re.compile(r'\b(\d+)\s*x\s*(\d+)\b')
+LEADING_ZEROS_PATTERN = re.compile(r'\b0+(\d+)\b')
+
+MATCHABLE_EXTENSIONS = ('.mkv', '.mp4', '.avi', '.nfo')
+
+
+def base_name(path: str) -> str:
+    """Retourne le nom du fichier sans dossier ni extension connue."""
+    name = path.replace('\\', '/').rsplit('/', 1)[-1]
+    if name.lower().endswith(MATCHABLE_EXTENSIONS):
+        name = name.rsplit('.', 1)[0]
+    return name
+
+
+@lru_cache(maxsize=16384)
+def normalize_filename(filename: str) -> str:
+    """
+    Normalise un nom de fichier pour une comparaison flexible.
+    Le résultat est mémorisé : un même nom n'est normalisé qu'une seule fois par processus.
+    """
+    if not filename:
+        return ''
+
+    title = base_name(filename).lower()
+    title = ''.join(c for c in unicodedata.normalize('NFKD', title) if not unicodedata.combining(c))
+
+    # Supprime les métadonnées courantes
+    title = BRACKETS_PATTERN.sub('', title)
+    title = RESOLUTION_PATTERN.sub('', title)
+    title = NOISE_PATTERN.sub('', title)
+
+    # Nettoyage final
+    title = SEPARATORS_PATTERN.sub(' ', title)
+    title = SEASON_EPISODE_PATTERN.sub(r' \2 ', title)
+
+    # Supprime les zéros non significatifs (ex: "02" -> "2")
+    title = LEADING_ZEROS_PATTERN.sub(r'\1', title)
+
+    return ' '.join(title.split())
+
+
+class FileIndex:
+    """
+    Index des fichiers vidéo d'un torrent par nom exact, nom en minuscules, nom normalisé
+    et nom renommé. Construit une seule fois, il permet de matcher chaque épisode en O(1).
+    """
+
+    def __init__(self, files: Sequence[str], rename_map: Optional[RenameMap] = None):
+        self.exact: Dict[str, int] = {}
+        self.lower: Dict[str, int] = {}
+        self.normalized: Dict[str, int] = {}
+        self.renamed: Dict[str, int] = {}
+
+        for index, path in enumerate(files):
+            if not path or not is_video(path):
+                continue
+            name = base_name(path)
+            # setdefault conserve le premier fichier en cas de doublon, comme l'ancien parcours linéaire
+            self.exact.setdefault(name, index)
+            self.lower.setdefault(name.lower(), index)
+            self.normalized.setdefault(normalize_filename(name), index)
+            new_name = rename_map.get(name) if rename_map else None
+            if new_name:
+                self.renamed.setdefault(normalize_filename(new_name), index)
+
+    def find(self, nfo_filename: str, rename_map: Optional[RenameMap] = None) -> Optional[int]:
+        """
+        Trouve l'index du fichier correspondant à un nfo_filename :
+        1. correspondance exacte, 2. normalisée, 3. via la liste de renommage (dans les deux sens).
+        """
+        if not nfo_filename:
+            return None
+        target = base_name(nfo_filename)
+
+        index = self.exact.get(target)
+        if index is None:
+            index = self.lower.get(target.lower())
+        if index is not None:
+            return index
+
+        normalized_target = normalize_filename(target)
+        index = self.normalized.get(normalized_target)
+        if index is not None:
+            return index
+
+        index = self.renamed.get(normalized_target)
+        if index is not None or not rename_map:
+            return index
+
+        # Le nfo porte le nouveau nom : on cherche l'ancien nom du fichier via la table inverse
+        for candidate in (rename_map.original(target), rename_map.get(target)):
+            if candidate:
+                index = self.normalized.get(normalize_filename(candidate))
+                if index is not None:
+                    return index
+        return None
+
+
+def match_episodes(episodes: Mapping[Hashable, str], files: Sequence[str], rename_map: Optional[RenameMap] = None) -> Dict[Hashable, Optional[int]]:
+    """
+    Matche N épisodes (clé -> nfo_filename) contre M fichiers en une seule passe.
+    Retourne pour chaque clé l'index du fichier trouvé, ou None.
+    """
+    file_index = FileIndex(files, rename_map)
+    return {key: file_index.find(nfo_filename, rename_map) for key, nfo_filename in episodes.items()}
+
+
+def find_best_file(files: Sequence[str], nfo_filename: str, rename_map: Optional[RenameMap] = None) -> Optional[int]:
+    """Raccourci pour matcher un seul épisode."""
+    return match_episodes({None: nfo_filename}, files, rename_map)[None]
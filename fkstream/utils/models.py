@@ -20,9 +20,24 @@ class AppSettings(BaseSettings):
     DATABASE_URL: Optional[str] = "username:password@hostname:port"
     DATABASE_PATH: Optional[str] = "data/fkstream.db"
     METADATA_TTL: Optional[int] = 86400  # 1 jour
+    METADATA_L1_CACHE_SIZE: Optional[int] = 512  # entrées par worker, 0 pour désactiver
+    METADATA_L1_CACHE_TTL: Optional[int] = 300  # 5 minutes
+    METADATA_PARTIAL_TTL: Optional[int] = 300  # 5 minutes
+    METADATA_STALE_GRACE: Optional[int] = 604800  # 7 jours
+    FANKAI_MAX_CONCURRENCY: Optional[int] = 8
+    METADATA_TTL_JITTER: Optional[float] = 0.1  # ±10 %
+    METADATA_PREWARM: Optional[bool] = True
+    METADATA_PREWARM_CONCURRENCY: Optional[int] = 4
     DEBRID_AVAILABILITY_TTL: Optional[int] = 86400  # 1 jour
+    DEBRID_DOWNLOADING_TTL: Optional[int] = 600  # 10 minutes
+    DEBRID_NEGATIVE_TTL: Optional[int] = 300  # 5 minutes
+    DEBRID_TTL_JITTER: Optional[float] = 0.1  # ±10 %
+    PREMIUM_STATUS_TTL: Optional[int] = 3600  # 1 heure
     SCRAPE_LOCK_TTL: Optional[int] = 300  # 5 minutes
     SCRAPE_WAIT_TIMEOUT: Optional[int] = 30  # 30 secondes
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: Optional[int] = 5
+    CIRCUIT_BREAKER_RESET_TIMEOUT: Optional[int] = 30  # 30 secondes
+    STREAM_DEADLINE: Optional[float] = 10.0  # 10 secondes
     DEBRID_PROXY_URL: Optional[str] = None
     CUSTOM_HEADER_HTML: Optional[str] = None
     PROXY_DEBRID_STREAM: Optional[bool] = False
@@ -57,6 +72,7 @@ class ConfigModel(BaseModel):
     debridStreamProxyPassword: Optional[str] = ""
     maxActorsDisplay: Optional[str] = "all"
     defaultSort: Optional[str] = "last_update"
+    catalogDisplay: Optional[str] = "full"
 
     @field_validator("debridService")
     def check_debrid_service(cls, v):
@@ -85,6 +101,13 @@ class ConfigModel(BaseModel):
             raise ValueError(f"Option de tri invalide. Doit être l'une des suivantes: {valid_sorts}")
         return v
 
+    @field_validator("catalogDisplay")
+    def check_catalog_display(cls, v):
+        valid_displays = ["full", "compact"]
+        if v not in valid_displays:
+            raise ValueError(f"Affichage du catalogue invalide. Doit être l'un des suivants: {valid_displays}")
+        return v
+
 
 default_config = ConfigModel().model_dump()
 
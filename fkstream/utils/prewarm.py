@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import Counter
+
+from fkstream.scrapers.fankai import FankaiAPI, refresh_anime_details, refresh_series_list
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import acquire_lock, get_metadata_expirations, new_lock_owner_id, release_lock
+from fkstream.utils.dataset import DatasetSnapshot
+from fkstream.utils.models import settings
+
+# Une entrée qui expire dans moins de ce délai est rechargée dès ce passage : une fraction de METADATA_TTL, plafonnée
+# (le plafond dépasse l'intervalle d'une heure entre deux passages). Un TTL court ne fait donc pas tout recharger à chaque passage.
+PREWARM_REFRESH_FRACTION = 0.25
+PREWARM_MAX_REFRESH_MARGIN = 2 * 3600
+
+# Un seul worker préchauffe à la fois ; le verrou expire de lui-même si le worker s'arrête en cours de route
+PREWARM_LOCK_KEY = "metadata_prewarm"
+PREWARM_LOCK_TTL = 1800
+
+
+class MetadataPrewarmer:
+    """
+    Préchauffage des métadonnées utilisées par les flux : fk:list et les détails de chaque anime du dataset.
+    Seules les entrées absentes ou proches de l'expiration sont rechargées, avec une concurrence bornée ;
+    les requêtes des utilisateurs trouvent ainsi le cache chaud.
+    """
+
+    def __init__(self, concurrency: int, refresh_margin: float):
+        self.concurrency = max(1, concurrency)
+        self.refresh_margin = refresh_margin
+
+    async def run(self, http_client, dataset: DatasetSnapshot) -> None:
+        """Un passage de préchauffage. Ignoré si un autre worker est déjà en train de préchauffer."""
+        owner_id = new_lock_owner_id()
+        if not await acquire_lock(PREWARM_LOCK_KEY, owner_id, PREWARM_LOCK_TTL):
+            logger.info("Prechauffage des metadonnees deja en cours sur un autre worker.")
+            return
+        try:
+            await self._run(FankaiAPI(http_client), dataset)
+        finally:
+            await release_lock(PREWARM_LOCK_KEY, owner_id)
+
+    async def _run(self, fankai_api: FankaiAPI, dataset: DatasetSnapshot) -> None:
+        start_time = time.time()
+        media_ids = ["fk:list"] + [f"fk:{api_id}" for api_id in sorted(dataset.api_ids)]
+        expirations = await get_metadata_expirations(media_ids)
+        deadline = start_time + self.refresh_margin
+        stale = [media_id for media_id in media_ids if expirations.get(media_id, 0) < deadline]
+        if not stale:
+            logger.info(f"Metadonnees deja chaudes ({len(media_ids)} entrees).")
+            return
+
+        logger.log("FKSTREAM", f"🔥 Prechauffage de {len(stale)}/{len(media_ids)} entrees de metadonnees...")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(media_id: str) -> str:
+            """Retourne "refreshed", "skipped" (déjà rechargée entre-temps par une requête utilisateur) ou "failed"."""
+            async with semaphore:
+                try:
+                    if (await get_metadata_expirations([media_id])).get(media_id, 0) >= deadline:
+                        return "skipped"
+                    if media_id == "fk:list":
+                        refreshed = await refresh_series_list(fankai_api)
+                    else:
+                        refreshed = await refresh_anime_details(fankai_api, media_id.split(":", 1)[1])
+                    return "refreshed" if refreshed else "failed"
+                except Exception as e:
+                    logger.warning(f"Prechauffage de {media_id} impossible: {e}")
+                    return "failed"
+
+        results = Counter(await asyncio.gather(*(warm(media_id) for media_id in stale)))
+        logger.log(
+            "FKSTREAM",
+            f"🔥 Prechauffage termine en {time.time() - start_time:.1f}s: {results['refreshed']}/{len(stale)} entrees rechargees, "
+            f"{results['skipped']} deja rechargees entre-temps, {results['failed']} en echec.",
+        )
+
+
+metadata_prewarmer = MetadataPrewarmer(
+    concurrency=settings.METADATA_PREWARM_CONCURRENCY,
+    refresh_margin=min(PREWARM_MAX_REFRESH_MARGIN, settings.METADATA_TTL * PREWARM_REFRESH_FRACTION),
+)
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import os
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.singleflight import SingleFlight
+
+# URL pour le fichier de renommage
+RENAME_FILE_URL = "https://raw.githubusercontent.com/Nackophilz/fankai_utilitaire/refs/heads/main/rename/films.txt"
+
+# Copie locale persistée du fichier de renommage et de son ETag
+RENAME_FILE_PATH = "/data/rename_map.txt"
+
+# Intervalle de rafraîchissement en arrière-plan (secondes)
+RENAME_REFRESH_INTERVAL = 3600
+
+
+class RenameMap:
+    """Dictionnaire de renommage immuable avec sa table inverse (nouveau nom -> ancien nom)."""
+
+    __slots__ = ("forward", "reverse", "version")
+
+    def __init__(self, forward: Mapping[str, str], version: str):
+        self.forward = MappingProxyType(dict(forward))
+        self.reverse = MappingProxyType({new: old for old, new in forward.items()})
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.forward)
+
+    def __bool__(self) -> bool:
+        return bool(self.forward)
+
+    def get(self, old_name: str) -> Optional[str]:
+        """Retourne le nouveau nom pour un ancien nom, ou None."""
+        return self.forward.get(old_name)
+
+    def original(self, new_name: str) -> Optional[str]:
+        """Retourne l'ancien nom pour un nouveau nom, ou None."""
+        return self.reverse.get(new_name)
+
+
+EMPTY_RENAME_MAP = RenameMap({}, version="empty")
+
+
+def parse_rename_file(content: str) -> RenameMap:
+    """Analyse le contenu du fichier de renommage ('ancien -> nouveau' par ligne)."""
+    rename_map = {}
+    for line in content.splitlines():
+        if " -> " in line:
+            old, new = line.split(" -> ", 1)
+            rename_map[old.strip()] = new.strip()
+    version = hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+    return RenameMap(rename_map, version)
+
+
+class RenameMapService:
+    """
+    Service de liste de renommage : chargé au démarrage depuis la copie locale,
+    rafraîchi en arrière-plan par GET conditionnel. Les requêtes ne font que lire `current`.
+    """
+
+    def __init__(self, url: str = RENAME_FILE_URL, path: str = RENAME_FILE_PATH):
+        self.url = url
+        self.path = path
+        self.current: RenameMap = EMPTY_RENAME_MAP
+        self._etag: Optional[str] = None
+        self._flight = SingleFlight("rename_map")
+
+    @property
+    def _etag_path(self) -> str:
+        return f"{self.path}.etag"
+
+    def load_from_disk(self) -> bool:
+        """Charge la copie locale si elle existe. Ne fait aucun appel réseau."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.current = parse_rename_file(f.read())
+            if os.path.exists(self._etag_path):
+                with open(self._etag_path, "r", encoding="utf-8") as f:
+                    self._etag = f.read().strip() or None
+            logger.info(f"Liste de renommage chargee depuis {self.path} ({len(self.current)} entrees).")
+            return True
+        except FileNotFoundError:
+            logger.info(f"Aucune copie locale de la liste de renommage ({self.path}).")
+        except Exception as e:
+            logger.warning(f"Impossible de charger la liste de renommage locale: {e}")
+        return False
+
+    def _save_to_disk(self, content: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(content)
+            with open(self._etag_path, "w", encoding="utf-8") as f:
+                f.write(self._etag or "")
+        except Exception as e:
+            logger.warning(f"Impossible d'ecrire la copie locale de la liste de renommage: {e}")
+
+    async def refresh(self, http_client) -> bool:
+        """
+        Rafraîchit la liste depuis GitHub avec un GET conditionnel (If-None-Match).
+        Les rafraîchissements simultanés sont regroupés en un seul appel.
+        Retourne True si la liste a changé.
+        """
+        return await self._flight.do(self.url, lambda: self._refresh(http_client))
+
+    async def _refresh(self, http_client) -> bool:
+        headers = {"If-None-Match": self._etag} if self._etag and self.current else {}
+        try:
+            response = await http_client.get(self.url, headers=headers, accept_statuses=(304,))
+        except Exception as e:
+            logger.warning(f"Echec du rafraichissement de la liste de renommage: {e}")
+            return False
+        if response.status_code == 304:
+            logger.debug("Liste de renommage inchangee (304).")
+            return False
+
+        content = response.text
+        rename_map = parse_rename_file(content)
+        self._etag = response.headers.get("ETag")
+        if rename_map.version == self.current.version:
+            return False
+
+        self.current = rename_map
+        self._save_to_disk(content)
+        logger.info(f"Liste de renommage mise a jour ({len(rename_map)} entrees).")
+        return True
+
+    async def run_periodic_refresh(self, http_client, interval: int = RENAME_REFRESH_INTERVAL):
+        """Boucle de rafraîchissement en arrière-plan."""
+        while True:
+            await self.refresh(http_client)
+            await asyncio.sleep(interval)
+
+
+# Instance globale partagée par le matching des flux et de StremThru
+rename_map_service = RenameMapService()
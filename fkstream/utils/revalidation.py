@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import get_stale_metadata_from_cache
+from fkstream.utils.deadline import detach
+
+# Après un rafraîchissement en échec, la copie périmée est servie sans nouvelle tentative pendant ce délai (secondes)
+REVALIDATION_RETRY_DELAY = 60
+
+MetadataLoader = Callable[[], Awaitable[Any]]
+
+
+class MetadataRevalidator:
+    """
+    Stale-while-revalidate et stale-if-error pour la table metadata.
+    Une entrée expirée mais encore dans la fenêtre de grâce est servie immédiatement
+    pendant qu'une seule tâche d'arrière-plan par entrée la rafraîchit.
+    Si le rafraîchissement échoue, la dernière copie valide continue d'être servie.
+    """
+
+    def __init__(self, retry_delay: float = REVALIDATION_RETRY_DELAY):
+        self.retry_delay = retry_delay
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._failed_at: Dict[str, float] = {}
+        self.served_stale = 0
+        self.stale_if_error = 0
+        self.revalidations = 0
+        self.revalidation_failures = 0
+
+    async def serve(self, media_id: str, load: MetadataLoader) -> Any:
+        """
+        Appelé après un échec de lecture du cache frais. Retourne la copie périmée en lançant son
+        rafraîchissement, ou à défaut attend `load` (chargement depuis l'API, mis en cache par `load`).
+        """
+        stale = await get_stale_metadata_from_cache(media_id)
+        if not stale:
+            return await load()
+
+        self.served_stale += 1
+        if media_id in self._failed_at and time.time() - self._failed_at[media_id] < self.retry_delay:
+            self.stale_if_error += 1
+            logger.debug(f"♻️ STALE: {media_id} servi perime (API en echec, nouvelle tentative differee)")
+        elif media_id not in self._tasks:
+            logger.info(f"♻️ STALE: {media_id} servi perime, rafraichissement en arriere-plan")
+            task = asyncio.create_task(self._revalidate(media_id, load))
+            self._tasks[media_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(media_id, None))
+        return stale
+
+    async def _revalidate(self, media_id: str, load: MetadataLoader) -> None:
+        # Le rafraîchissement n'est pas limité par l'échéance de la requête qui a servi la copie périmée
+        detach()
+        self.revalidations += 1
+        try:
+            data = await load()
+        except Exception as e:
+            logger.warning(f"Rafraichissement de {media_id} impossible: {e}")
+            data = None
+        if data:
+            self._failed_at.pop(media_id, None)
+            return
+        self.revalidation_failures += 1
+        self._failed_at[media_id] = time.time()
+        logger.warning(f"⚠️ Rafraichissement de {media_id} en echec, la copie perimee reste servie")
+
+    def stats(self) -> dict:
+        return {
+            "served_stale": self.served_stale,
+            "stale_if_error": self.stale_if_error,
+            "revalidations": self.revalidations,
+            "revalidation_failures": self.revalidation_failures,
+            "revalidating": len(self._tasks),
+        }
+
+
+metadata_revalidator = MetadataRevalidator()
@@ -0,0 +1,244 @@
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from fkstream.utils.catalog import MaterializedCatalog, fold_text
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import get_many_metadata_from_cache
+from fkstream.utils.dataset import DatasetSnapshot
+
+# Poids des champs indexés
+TITLE_WEIGHT = 3.0
+ALTERNATE_NAME_WEIGHT = 2.5
+ACTOR_WEIGHT = 2.0
+EPISODE_TITLE_WEIGHT = 1.0
+
+# Qualité d'une correspondance de mot
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.4
+
+# Bonus quand la requête complète apparaît telle quelle dans le titre
+TITLE_PHRASE_BONUS = 5.0
+
+# Champs des détails pouvant contenir un autre nom de la série
+ALTERNATE_NAME_FIELDS = ("original_title", "alternative_title", "alternative_titles")
+
+# Nombre de requêtes normalisées conservées en cache par index
+SEARCH_CACHE_SIZE = 1024
+
+# Âge maximal de l'index avant une reconstruction en arrière-plan (nouveaux détails en cache)
+SEARCH_INDEX_REFRESH_INTERVAL = 300
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte en mots minuscules sans accents."""
+    return TOKEN_PATTERN.findall(fold_text(text))
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(token: str) -> int:
+    """Nombre de fautes tolérées selon la longueur du mot."""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def _within_distance(a: str, b: str, max_distance: int) -> bool:
+    """Distance de Levenshtein bornée : s'arrête dès que la borne est dépassée."""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return False
+        previous = current
+    return previous[-1] <= max_distance
+
+
+@dataclass(frozen=True, slots=True)
+class SearchDocument:
+    """Textes indexés d'un anime, avec le poids de chaque champ."""
+    anime_id: str
+    fields: Tuple[Tuple[float, str], ...]
+
+
+class SearchIndex:
+    """
+    Index inversé mot -> {anime_id: meilleur poids}, vocabulaire trié pour les préfixes
+    et postings de trigrammes pour la tolérance aux fautes de frappe.
+    """
+
+    def __init__(self, version: tuple, documents: List[SearchDocument], titles: Dict[str, str]):
+        self.version = version
+        self.titles = titles
+        self.postings: Dict[str, Dict[str, float]] = {}
+        for document in documents:
+            for weight, text in document.fields:
+                for token in tokenize(text):
+                    posting = self.postings.setdefault(token, {})
+                    if weight > posting.get(document.anime_id, 0.0):
+                        posting[document.anime_id] = weight
+
+        self.vocabulary: List[str] = sorted(self.postings)
+        self.trigrams: Dict[str, List[str]] = {}
+        for token in self.vocabulary:
+            if len(token) >= 3:
+                for trigram in _trigrams(token):
+                    self.trigrams.setdefault(trigram, []).append(token)
+
+        self._cache: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def _expand(self, query_token: str) -> Dict[str, float]:
+        """Mots du vocabulaire correspondant à un mot de la requête, avec la qualité de la correspondance."""
+        matches = {}
+        if query_token in self.postings:
+            matches[query_token] = EXACT_MATCH
+
+        if len(query_token) >= 2:
+            start = bisect_left(self.vocabulary, query_token)
+            for token in self.vocabulary[start:]:
+                if not token.startswith(query_token):
+                    break
+                matches.setdefault(token, PREFIX_MATCH)
+
+        max_typos = _max_typos(query_token)
+        if max_typos:
+            query_trigrams = _trigrams(query_token)
+            shared = Counter(token for trigram in query_trigrams for token in self.trigrams.get(trigram, ()))
+            # Chaque faute retire au plus 3 trigrammes communs
+            min_shared = max(1, len(query_trigrams) - 3 * max_typos)
+            for token, count in shared.items():
+                if count >= min_shared and token not in matches and _within_distance(query_token, token, max_typos):
+                    matches[token] = FUZZY_MATCH
+        return matches
+
+    def _score(self, normalized_query: str) -> Dict[str, float]:
+        query_tokens = normalized_query.split()
+        scores: Optional[Dict[str, float]] = None
+        for query_token in query_tokens:
+            token_scores: Dict[str, float] = {}
+            for token, quality in self._expand(query_token).items():
+                for anime_id, weight in self.postings[token].items():
+                    score = weight * quality
+                    if score > token_scores.get(anime_id, 0.0):
+                        token_scores[anime_id] = score
+            # Tous les mots de la requête doivent correspondre
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {anime_id: scores[anime_id] + score for anime_id, score in token_scores.items() if anime_id in scores}
+        scores = scores or {}
+
+        for anime_id, title in self.titles.items():
+            if normalized_query in title:
+                scores[anime_id] = scores.get(anime_id, 0.0) + TITLE_PHRASE_BONUS
+        return scores
+
+    def search(self, query: str) -> Dict[str, float]:
+        """Retourne {anime_id: score} pour une requête ; les résultats sont mis en cache par requête normalisée."""
+        normalized_query = ' '.join(tokenize(query))
+        if not normalized_query:
+            return {}
+        cached = self._cache.get(normalized_query)
+        if cached is not None:
+            self._cache.move_to_end(normalized_query)
+            return cached
+
+        scores = self._score(normalized_query)
+        self._cache[normalized_query] = scores
+        if len(self._cache) > SEARCH_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return scores
+
+
+def _as_texts(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if isinstance(v, str) and v]
+    return []
+
+
+def build_search_document(anime_id: str, dataset: DatasetSnapshot, details: Optional[dict]) -> SearchDocument:
+    """Rassemble les noms alternatifs (dataset et détails), titres d'épisodes et acteurs d'un anime."""
+    fields: List[Tuple[float, str]] = []
+    entry = dataset.get(anime_id)
+    if entry and entry.name:
+        fields.append((ALTERNATE_NAME_WEIGHT, entry.name))
+    if details:
+        if details.get('title'):
+            fields.append((TITLE_WEIGHT, details['title']))
+        for field_name in ALTERNATE_NAME_FIELDS:
+            fields.extend((ALTERNATE_NAME_WEIGHT, text) for text in _as_texts(details.get(field_name)))
+        for actor in details.get('actors') or []:
+            if actor.get('name'):
+                fields.append((ACTOR_WEIGHT, actor['name']))
+        for season in details.get('seasons') or []:
+            for episode in season.get('episodes') or []:
+                if episode.get('title'):
+                    fields.append((EPISODE_TITLE_WEIGHT, episode['title']))
+    return SearchDocument(anime_id=anime_id, fields=tuple(fields))
+
+
+class CatalogSearch:
+    """
+    Moteur de recherche du catalogue. L'index est construit pour une version du catalogue
+    à partir des détails déjà en cache, puis reconstruit en arrière-plan pour intégrer
+    les détails mis en cache depuis.
+    """
+
+    def __init__(self, refresh_interval: int = SEARCH_INDEX_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._index: Optional[SearchIndex] = None
+        self._built_at = 0.0
+        self._build_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _build(self, catalog: MaterializedCatalog, dataset: DatasetSnapshot) -> SearchIndex:
+        anime_ids = list(catalog.search_keys)
+        details = await get_many_metadata_from_cache([f"fk:{anime_id}" for anime_id in anime_ids])
+        documents = []
+        for anime_id in anime_ids:
+            document = build_search_document(anime_id, dataset, details.get(f"fk:{anime_id}"))
+            # Le titre de fk:list est toujours indexé, même sans détails en cache
+            documents.append(SearchDocument(anime_id, ((TITLE_WEIGHT, catalog.search_keys[anime_id]),) + document.fields))
+        index = SearchIndex(catalog.version, documents, dict(catalog.search_keys))
+        self._index = index
+        self._built_at = time.monotonic()
+        logger.info(f"🔎 SEARCH - Index de recherche construit ({len(documents)} animes, {len(details)} avec details, {len(index.vocabulary)} mots)")
+        return index
+
+    async def _refresh(self, catalog: MaterializedCatalog, dataset: DatasetSnapshot) -> None:
+        try:
+            async with self._build_lock:
+                await self._build(catalog, dataset)
+        except Exception as e:
+            logger.warning(f"Echec de la reconstruction de l'index de recherche: {e}")
+
+    async def search(self, catalog: MaterializedCatalog, dataset: DatasetSnapshot, query: str) -> Dict[str, float]:
+        """Retourne {anime_id: score} pour une requête, en (re)construisant l'index si nécessaire."""
+        index = self._index
+        if index is None or index.version != catalog.version:
+            async with self._build_lock:
+                index = self._index
+                if index is None or index.version != catalog.version:
+                    index = await self._build(catalog, dataset)
+        elif time.monotonic() - self._built_at > self.refresh_interval and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh(catalog, dataset))
+        return index.search(query)
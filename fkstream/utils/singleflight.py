@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fkstream.utils.common_logger import logger
+from fkstream.utils.database import DistributedLock, LockAcquisitionError
+from fkstream.utils.deadline import detach, wait_within_deadline
+
+# Toutes les instances, pour les métriques
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """
+    Regroupement des appels simultanés d'une même opération, identifiée par une clé logique :
+    la première demande lance l'exécution, les suivantes attendent son résultat.
+    En mode distribué, l'exécution se fait sous DistributedLock ; les autres workers attendent
+    le verrou puis relisent le résultat partagé (cache en base) via `recheck` au lieu de relancer l'appel.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        _registry[name] = self
+
+    async def do(
+        self,
+        key: Hashable,
+        func: Callable[[], Awaitable[Any]],
+        distributed: bool = False,
+        recheck: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """
+        Exécute `func` une seule fois pour toutes les demandes simultanées de `key` et retourne son résultat.
+        `recheck` (mode distribué) retourne le résultat déjà produit par un autre worker, ou une valeur vide.
+        L'annulation d'un appelant n'interrompt pas l'exécution partagée. L'exécution n'a pas d'échéance :
+        chaque appelant n'attend au plus que son propre budget restant, et le résultat complet profite aux suivants.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.create_task(self._execute(key, func, distributed, recheck))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await wait_within_deadline(asyncio.shield(task))
+
+    async def _execute(self, key: Hashable, func, distributed: bool, recheck) -> Any:
+        # La tâche hérite du contexte du premier appelant : son échéance ne doit pas tronquer le résultat partagé
+        detach()
+        if not distributed:
+            return await func()
+
+        lock_key = f"singleflight_{self.name}_{key}"
+        try:
+            async with DistributedLock(lock_key):
+                if recheck is not None:
+                    result = await recheck()
+                    if result:
+                        logger.log("LOCK", f"✅ Resultat deja produit par un autre worker pour {lock_key}")
+                        return result
+                return await func()
+        except LockAcquisitionError:
+            logger.warning(f"Impossible d'acquerir le verrou {lock_key}, execution sans verrou.")
+            return await func()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "executions": self.executions, "in_flight": len(self._inflight)}
+
+
+def singleflight_stats() -> dict:
+    """Compteurs de chaque regroupement : appels reçus, exécutions réelles, exécutions en cours."""
+    return {name: flight.stats() for name, flight in _registry.items()}
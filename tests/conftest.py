@@ -0,0 +1,14 @@
+import os
+import tempfile
+
+import pytest
+
+# Les réglages et l'instance `database` sont construits à l'import de fkstream :
+# la base SQLite de test doit être choisie avant le premier import.
+os.environ["DATABASE_TYPE"] = "sqlite"
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="fkstream-tests-"), "fkstream.db")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,105 @@
+import pytest
+
+from fkstream.utils import circuit_breaker
+from fkstream.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "time", clock)
+    return clock
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and not breaker.is_open
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.is_open
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+
+    clock.now += 30
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Sonde en cours : les autres requêtes sont refusées
+    assert breaker.is_open
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED and not breaker.is_open and breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.is_open
+    assert breaker.times_opened == 2
+
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_half_open_without_probe_is_not_reported_open(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    # La sonde est annulée avant d'avoir pu enregistrer son résultat
+    breaker._probe_started_at = None
+    assert breaker.state == HALF_OPEN
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_stuck_half_open_probe_expires(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    # La sonde ne rend jamais compte de son résultat : passé reset_timeout,
+    # is_open et allow() s'accordent pour laisser partir une nouvelle sonde
+    clock.now += 29
+    assert breaker.is_open and not breaker.allow()
+    clock.now += 1
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.is_open
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from fkstream.utils import database as db
+from fkstream.utils.database import (_migrate_debrid_availability_to_hash_key, _table_columns, get_debrid_from_cache,
+                                     get_many_debrid_from_cache, save_debrid_to_cache, save_many_debrid_to_cache)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def database():
+    await db.setup_database()
+    await db.database.execute("DELETE FROM debrid_availability")
+    yield db.database
+    await db.teardown_database()
+
+
+async def test_bulk_upsert_and_read(database):
+    statuses = {f"{i:040x}": "cached" if i % 2 else "downloading" for i in range(1200)}
+    await save_many_debrid_to_cache(statuses, "realdebrid")
+
+    cached = await get_many_debrid_from_cache(list(statuses), "realdebrid", chunk_size=500)
+    assert {hash: row["status"] for hash, row in cached.items()} == statuses
+    assert await get_many_debrid_from_cache(list(statuses), "alldebrid") == {}
+
+
+async def test_upsert_overwrites_existing_status(database):
+    hash = "a" * 40
+    await save_debrid_to_cache(hash, "realdebrid", "downloading")
+    await save_many_debrid_to_cache({hash: "cached", "b" * 40: "unknown"}, "realdebrid")
+
+    assert await get_debrid_from_cache(hash, "realdebrid") == {"status": "cached"}
+    assert await database.fetch_val("SELECT count(*) FROM debrid_availability") == 2
+
+
+async def test_expired_rows_are_ignored(database):
+    hash = "c" * 40
+    await save_debrid_to_cache(hash, "realdebrid", "cached")
+    await database.execute("UPDATE debrid_availability SET expires_at = :past", {"past": time.time() - 1})
+    assert await get_debrid_from_cache(hash, "realdebrid") is None
+
+
+async def test_migration_from_per_episode_table(database):
+    await database.execute("DROP TABLE debrid_availability")
+    await database.execute("CREATE TABLE debrid_availability (media_id TEXT NOT NULL, hash TEXT NOT NULL, debrid_service TEXT NOT NULL, status TEXT NOT NULL, timestamp REAL NOT NULL, expires_at REAL, PRIMARY KEY (media_id, hash, debrid_service))")
+    expires_at = time.time() + 3600
+    rows = [
+        ("fk:1:1", "d" * 40, "realdebrid", "downloading", 100.0),
+        ("fk:1:2", "d" * 40, "realdebrid", "cached", 200.0),
+        ("fk:1:1", "d" * 40, "alldebrid", "unknown", 150.0),
+        ("fk:2:1", "e" * 40, "realdebrid", "cached", 50.0),
+    ]
+    for media_id, hash, service, status, timestamp in rows:
+        await database.execute(
+            "INSERT INTO debrid_availability VALUES (:media_id, :hash, :service, :status, :timestamp, :expires_at)",
+            {"media_id": media_id, "hash": hash, "service": service, "status": status, "timestamp": timestamp, "expires_at": expires_at},
+        )
+
+    await _migrate_debrid_availability_to_hash_key()
+
+    assert "media_id" not in await _table_columns("debrid_availability")
+    assert await _table_columns("debrid_availability_legacy") == set()
+    migrated = await database.fetch_all("SELECT hash, debrid_service, status FROM debrid_availability ORDER BY hash, debrid_service")
+    assert [(row["hash"], row["debrid_service"], row["status"]) for row in migrated] == [
+        ("d" * 40, "alldebrid", "unknown"),
+        ("d" * 40, "realdebrid", "cached"),
+        ("e" * 40, "realdebrid", "cached"),
+    ]
+
+    # Relancer la migration sur une base déjà migrée ne change rien
+    await _migrate_debrid_availability_to_hash_key()
+    assert await database.fetch_val("SELECT count(*) FROM debrid_availability") == 3
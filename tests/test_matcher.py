@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import orjson
+import pytest
+
+from benchmarks.legacy_matcher import stream_find_best_file
+from fkstream.utils.general import is_video
+from fkstream.utils.matcher import base_name, match_episodes
+
+DATASET_PATH = Path(__file__).resolve().parent.parent / "dataset.json"
+
+
+def _dataset_sources():
+    dataset = orjson.loads(DATASET_PATH.read_bytes())
+    for anime in dataset.get("top", []):
+        for source in anime.get("sources", []):
+            yield source.get("files", [])
+
+
+@pytest.mark.parametrize("variant", [str, str.lower, str.upper])
+def test_matches_at_least_what_the_old_matcher_found(variant):
+    """Sur dataset.json, chaque épisode trouvé par l'ancien matcher l'est aussi par le nouveau, au même fichier ou à un équivalent."""
+    checked = 0
+    for files in _dataset_sources():
+        episodes = {index: f"{variant(base_name(name))}.nfo" for index, name in enumerate(files) if is_video(name)}
+        new = match_episodes(episodes, files)
+        for index, nfo_filename in episodes.items():
+            old = stream_find_best_file(files, nfo_filename)
+            if old is None:
+                continue
+            assert new[index] is not None
+            if old != new[index]:
+                # Plusieurs fichiers se normalisent pareil (VO/VF) : le nouveau moteur préfère le nom identique à la casse près
+                assert base_name(files[new[index]]).lower() == base_name(nfo_filename).lower()
+            checked += 1
+    assert checked > 1000
+
+
+def test_exact_names_match_like_the_old_matcher():
+    for files in _dataset_sources():
+        episodes = {index: f"{base_name(name)}.nfo" for index, name in enumerate(files) if is_video(name)}
+        new = match_episodes(episodes, files)
+        assert new == {index: stream_find_best_file(files, nfo_filename) for index, nfo_filename in episodes.items()}
+
+
+def test_unknown_episode_is_not_matched():
+    files = next(files for files in _dataset_sources() if files)
+    assert match_episodes({"x": "Episode inexistant 99.nfo"}, files) == {"x": None}